@@ -0,0 +1,130 @@
+'''
+Background recomputation for the Streamlit front end.
+
+A BackgroundJobs instance lives in the user's session and owns a small thread pool. Each job
+has a key (the basin table, a design point, a pipe) and a content key describing its inputs.
+On every edit the app resubmits everything; only keys whose content changed get a new job.
+Every submission takes a new generation number:
+queued jobs of older generations for the same key are cancelled, and results from ones already
+running are dropped when they finish, so a slow stale job can never overwrite a newer result.
+
+The script rerun never waits on the pool. It reads progress() and results() (whatever has
+finished so far) and polls again on its next rerun.
+'''
+
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rational import RETURN_PERIODS, BasinTable, route_arrays
+
+
+class BackgroundJobs:
+    def __init__(self, max_workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mhfd-bg")
+        # Threads are released when the session (and this object) goes away
+        self._finalizer = weakref.finalize(self, self._pool.shutdown, wait=False, cancel_futures=True)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._content = {}      # key -> content key of the latest submission
+        self._pending = {}      # key -> (generation, Future)
+        self._results = {}      # key -> result of the latest submission
+        self._errors = {}       # key -> exception of the latest submission
+
+    def submit(self, key, content_key, fn, *args) -> bool:
+        # Queue fn(*args) for key unless the same inputs were already submitted.
+        # Returns True when a new job was started
+        with self._lock:
+            if self._content.get(key) == content_key:
+                return False
+            self.generation += 1
+            generation = self.generation
+            stale = self._pending.pop(key, None)
+            if stale is not None:
+                stale[1].cancel()
+            self._content[key] = content_key
+            self._results.pop(key, None)
+            self._errors.pop(key, None)
+            future = self._pool.submit(fn, *args)
+            self._pending[key] = (generation, future)
+        future.add_done_callback(lambda f: self._finish(key, generation, f))
+        return True
+
+    def _finish(self, key, generation, future):
+        if future.cancelled():
+            return
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None or current[0] != generation:
+                return      # superseded by a newer submission while running
+            del self._pending[key]
+            error = future.exception()
+            if error is None:
+                self._results[key] = future.result()
+            else:
+                self._errors[key] = error
+
+    def retain(self, keys):
+        # Forget (and cancel) every key not in `keys`, e.g. deleted basins
+        keys = set(keys)
+        with self._lock:
+            for key in [k for k in self._content if k not in keys]:
+                del self._content[key]
+                self._results.pop(key, None)
+                self._errors.pop(key, None)
+                stale = self._pending.pop(key, None)
+                if stale is not None:
+                    stale[1].cancel()
+
+    def progress(self):
+        # (finished, total) over the current keys
+        with self._lock:
+            total = len(self._content)
+            return total - len(self._pending), total
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._pending)
+
+    def results(self) -> dict:
+        # Snapshot of the finished results of the current submissions
+        with self._lock:
+            return dict(self._results)
+
+    def errors(self) -> dict:
+        with self._lock:
+            return dict(self._errors)
+
+    def shutdown(self):
+        self._finalizer()
+
+
+# Jobs ---------------------------------------------------------------------------------------------
+
+def basin_table_job(df_basins: pd.DataFrame, df_areas: pd.DataFrame, P1_dict: dict[str, float]) -> dict:
+    # Every basin at once through BasinTable (same values as SubBasin), plus the outlet peak
+    # with all of them routed together. Basins without areas are left out
+    basins = df_basins[df_basins["basin_id"].isin(df_areas["basin_id"])]
+    if basins.empty:
+        return {"table": pd.DataFrame(), "outlet": None}
+    area_basin_idx = pd.Index(basins["basin_id"]).get_indexer(df_areas["basin_id"])
+    table = BasinTable(
+        basins["basin_id"].to_numpy(),
+        basins["Li"], basins["Si"], basins["Lt"], basins["St"], basins["K"],
+        area_basin_idx,
+        df_areas["area_acres"],
+        df_areas["soil_group"].to_numpy(),
+        df_areas["impervious_fraction"],
+        P1_dict,
+        tc=basins["tc_min"],
+    )
+    c_cols = table.c[:, [RETURN_PERIODS.index(key) for key in table.return_periods]]
+    peak_q, peak_tc, _ = route_arrays(
+        table.tc, table.basin_area_ac[:, None] * c_cols, np.array(list(P1_dict.values()), dtype=float)
+    )
+    outlet = {"q": dict(zip(P1_dict, peak_q.tolist())), "tc": dict(zip(P1_dict, peak_tc.tolist()))}
+    return {"table": table.to_dataframe(), "outlet": outlet}
@@ -0,0 +1,435 @@
+'''
+Benchmarks and correctness checks for the hydrology / hydraulics kernels.
+
+    python benchmarks.py                      # run, compare with bench_baseline.json if present
+    python benchmarks.py --save-baseline      # record this machine's throughput as the baseline
+    python benchmarks.py --quick              # sizes up to 1k only
+
+Each kernel is timed at 10, 1k, 100k and 1M inputs (the per-call scalar / scipy kernels only
+at the sizes they can finish in reasonable time) and reported as inputs per second.
+Correctness is checked against independent values: the published C equations, a brute-force
+routing double loop, Manning's equation at the solved normal depths, the closed-form Horton
+curve and the one-inch unit hydrograph volume. The demo basins of rational.py are compared with
+recorded regression snapshots of this code's own output, which flag unintended changes but
+are not external references. Importing the numeric core is also timed in a
+fresh interpreter and must not load scipy, matplotlib or pandas. The run exits nonzero when
+any correctness, snapshot or import check fails, or when a kernel's throughput (or import speed) drops more
+than --tolerance below the baseline. Baselines are per machine and not kept in the repository;
+without one the throughput check is reported as skipped, or failed with --require-baseline.
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+import conduits
+import cuhp
+import rational
+
+SIZES = (10, 1_000, 100_000, 1_000_000)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Demo design storm (rational.py __main__)
+P1 = {
+    "cWQE": 0.60,
+    "c002": 0.84,
+    "c005": 1.13,
+    "c010": 1.39,
+    "c025": 1.77,
+    "c050": 2.08,
+    "c100": 2.42,
+    "c500": 3.30
+}
+P1_KEYS = list(P1)
+
+
+# Correctness ----------------------------------------------------------------------------------
+
+def _demo_subbasins():
+    sb_a = rational.SubBasin(
+        name="A", Li=100, Si=0.02, Lt=200, St=0.025, K=20, P1_dict=P1,
+        areas=[rational.Area(3.0, "A", 0.65), rational.Area(10.0, "B", 0.15)],
+    )
+    sb_b = rational.SubBasin(
+        name="B", Li=150, Si=0.01, Lt=120, St=0.03, K=20, P1_dict=P1,
+        areas=[rational.Area(2.0, "A", 0.90), rational.Area(6.0, "B", 0.75), rational.Area(11.0, "C/D", 0.20)],
+    )
+    return sb_a, sb_b
+
+
+def _uh_depth_worst(dt_min, n=2000):
+    # Runoff depth (in) held by the CUHP unit hydrograph farthest from one inch, over random
+    # subcatchments from rural to fully impervious
+    rng = _rng()
+    length = rng.uniform(300, 15000, n)
+    params = np.column_stack([
+        rng.uniform(0.5, 640, n), length, length * rng.uniform(0.3, 0.6, n),
+        rng.uniform(0.002, 0.06, n), rng.uniform(0, 1, n),
+    ])
+    with warnings.catch_warnings():
+        # The scaled-down (clamped-tail) rows are exactly what this check exercises
+        warnings.simplefilter("ignore", RuntimeWarning)
+        uh = cuhp._unit_hydrograph_batch(params, dt_min)
+    depth = np.array([u.sum() for u in uh]) * dt_min * 60 / (params[:, 0] * 43560 / 12)
+    return float(depth[np.argmax(np.abs(depth - 1.0))])
+
+
+def _routing_brute_force(tc, ca, P1, a=28.5, b=10.0, c=0.786):
+    # The spreadsheet's double loop: every basin's tc as the storm duration, slower basins
+    # contributing tc / own tc of their C*A. Independent of route_arrays' sorted sums
+    tc, ca = np.asarray(tc, dtype=float), np.asarray(ca, dtype=float)
+    fraction = np.minimum(1.0, tc[:, None] / tc[None, :])           # (scenario, basin)
+    intensity = a * np.asarray(P1)[None, :] / (b + tc[:, None])**c   # (scenario, R)
+    return (intensity * (fraction @ ca)).max(axis=0)
+
+
+def _manning_circ(depth, D, slope, n):
+    # Manning Q for a circular section at the given depth, from the segment geometry
+    theta = 2 * np.arccos(1 - 2 * depth / D)
+    area = D**2 / 8 * (theta - np.sin(theta))
+    return 1.49 / n * area * (area / (D * theta / 2))**(2 / 3) * np.sqrt(slope)
+
+
+def _manning_rect(depth, width, slope, n):
+    area = width * depth
+    return 1.49 / n * area * (area / (width + 2 * depth))**(2 / 3) * np.sqrt(slope)
+
+
+def _correctness_checks():
+    # (name, computed, expected, relative tolerance). Expected values come from the published
+    # equations or an independent calculation, not from this code's own output
+    sb_a, sb_b = _demo_subbasins()
+    tc = [sb_a.tc, sb_b.tc]
+    ca = [[sb.basin_area_ac * sb.c_dict[key] for key in P1] for sb in (sb_a, sb_b)]
+    dp_q, _ = rational.route_sbs_at_dp([sb_a, sb_b])
+    brute = _routing_brute_force(tc, ca, list(P1.values()))
+    table = rational.BasinTable.from_subbasins([sb_a, sb_b])
+    c100 = table.return_periods.index("c100")
+    circ_scipy = float(conduits.circ_normal_given_Q(10, 1.5, 0.05, 0.014)[0])
+    circ_vec = float(conduits.circ_normal_depth(10, 1.5, 0.05, 0.014)[0])
+    rect_scipy = float(conduits.rect_normal_given_Q(10, 3, 0.03, 0.012)[0])
+    rect_vec = float(conduits.rect_normal_depth(10, 3, 0.03, 0.012)[0])
+    return [
+        # MHFD C100 equation for soil group B: 0.465 * imp + 0.426
+        ("C100 soil B 75% imp", rational.get_c_inflitration("B", 0.75)["c100"], 0.465 * 0.75 + 0.426, 1e-12),
+        ("C array = C equations", float(rational.get_c_array(["C/D"], [0.4])[0, 6]),
+         rational.get_c_inflitration("C/D", 0.4)["c100"], 1e-12),
+        ("DP A+B Q2 vs double loop", dp_q["c002"], float(brute[P1_KEYS.index("c002")]), 1e-12),
+        ("DP A+B Q100 vs double loop", dp_q["c100"], float(brute[P1_KEYS.index("c100")]), 1e-12),
+        ("BasinTable = SubBasin Q100", table.discharge[1, c100], sb_b.discharge_dict["c100"], 1e-12),
+        # Normal depths: Manning's Q at the solved depth must give back the design Q
+        ("circ depth scipy, Q", float(_manning_circ(circ_scipy, 1.5, 0.05, 0.014)), 10.0, 1e-4),
+        ("circ depth vectorized, Q", float(_manning_circ(circ_vec, 1.5, 0.05, 0.014)), 10.0, 1e-6),
+        ("rect depth scipy, Q", float(_manning_rect(rect_scipy, 3, 0.03, 0.012)), 10.0, 1e-4),
+        ("rect depth vectorized, Q", float(_manning_rect(rect_vec, 3, 0.03, 0.012)), 10.0, 1e-6),
+        # fi = 3.0 in/hr decaying to f0 = 0.5 in/hr with alpha = 0.0018 1/s
+        ("horton f(600 s)", float(cuhp.horton_t(0.5, 3.0, 0.0018, 600.0)), 0.5 + 2.5 * np.exp(-1.08), 1e-12),
+        # A unit hydrograph holds one inch of runoff by definition
+        ("UH depth worst, dt 1 min", _uh_depth_worst(1.0), 1.0, 1e-9),
+        ("UH depth worst, dt 5 min", _uh_depth_worst(5.0), 1.0, 1e-9),
+    ]
+
+
+def _snapshot_checks():
+    # (name, computed, recorded, relative tolerance). Regression snapshots: this code's own
+    # results for the rational.py demo basins, recorded when they were checked by hand. They
+    # catch unintended changes, not formula errors that were already present when recorded;
+    # update them deliberately when a method change is intended
+    sb_a, sb_b = _demo_subbasins()
+    dp_q, dp_tc = rational.route_sbs_at_dp([sb_a, sb_b])
+    return [
+        ("basin A tc", sb_a.tc, 14.00480895008225, 1e-9),
+        ("basin A Q2", sb_a.discharge_dict["c002"], 4.621107402234657, 1e-9),
+        ("basin A Q100", sb_a.discharge_dict["c100"], 38.60760289680069, 1e-9),
+        ("basin B tc", sb_b.tc, 16.2384415949268, 1e-9),
+        ("basin B Q2", sb_b.discharge_dict["c002"], 12.027675749359505, 1e-9),
+        ("basin B Q100", sb_b.discharge_dict["c100"], 66.08361772902087, 1e-9),
+        ("DP A+B Q2", dp_q["c002"], 16.336662838274215, 1e-9),
+        ("DP A+B Q100", dp_q["c100"], 102.08357356986824, 1e-9),
+        ("DP A+B tc100", dp_tc["c100"], 16.2384415949268, 1e-9),
+    ]
+
+
+# Import time ------------------------------------------------------------------------------------
+
+CORE_MODULES = ("records", "rational", "conduits", "cuhp")
+# Loaded on first use only; importing the core must not pull these in
+LAZY_MODULES = ("scipy", "matplotlib", "pandas")
+
+
+def import_check(repeat: int = 3):
+    # Import the numeric core in fresh interpreters: (best seconds, lazy modules that got loaded)
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {', '.join(CORE_MODULES)}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"loaded = sorted({{m.split('.')[0] for m in sys.modules}} & {set(LAZY_MODULES)!r})\n"
+        "print(elapsed, *loaded)\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    best, loaded = np.inf, []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True)
+        elapsed, *loaded = out.stdout.split()
+        best = min(best, float(elapsed))
+    return best, loaded
+
+
+# Kernels ----------------------------------------------------------------------------------------
+# Each case builds its inputs for n items and returns a zero-argument callable to time
+
+def _rng():
+    return np.random.default_rng(20240501)
+
+
+def _areas(n):
+    rng = _rng()
+    groups = rng.choice(rational.SOIL_GROUPS, n)
+    imps = rng.uniform(0.0, 1.0, n)
+    return groups, imps
+
+
+def case_c_scalar(n):
+    groups, imps = _areas(n)
+    groups, imps = groups.tolist(), imps.tolist()
+    return lambda: [rational.get_c_inflitration(g, i) for g, i in zip(groups, imps)]
+
+
+def case_c_array(n):
+    groups, imps = _areas(n)
+    return lambda: rational.get_c_array(groups, imps)
+
+
+def _basin_columns(n):
+    rng = _rng()
+    return {
+        "Li": rng.uniform(50, 300, n),
+        "Si": rng.uniform(0.005, 0.05, n),
+        "Lt": rng.uniform(100, 3000, n),
+        "St": rng.uniform(0.005, 0.05, n),
+        "K": np.full(n, 20.0),
+    }
+
+
+def case_subbasin(n):
+    # n basins of three areas each, built and evaluated one object at a time
+    cols = _basin_columns(n)
+    groups, imps = _areas(3 * n)
+
+    def run():
+        for i in range(n):
+            areas = [rational.Area(1.0 + j, groups[3 * i + j], imps[3 * i + j]) for j in range(3)]
+            sb = rational.SubBasin(
+                name=str(i), Li=cols["Li"][i], Si=cols["Si"][i], Lt=cols["Lt"][i],
+                St=cols["St"][i], K=cols["K"][i], areas=areas, P1_dict=P1,
+            )
+            sb.discharge_dict
+    return run
+
+
+def case_basin_table(n):
+    cols = _basin_columns(n)
+    groups, imps = _areas(3 * n)
+    idx = np.repeat(np.arange(n), 3)
+    area_ac = np.tile([1.0, 2.0, 3.0], n)
+    names = np.arange(n)
+    return lambda: rational.BasinTable(
+        names, cols["Li"], cols["Si"], cols["Lt"], cols["St"], cols["K"], idx, area_ac, groups, imps, P1,
+    )
+
+
+def case_route_sbs(n):
+    # One design point with n tributary sub-basins (tc / C values cached beforehand)
+    sb_a, sb_b = _demo_subbasins()
+    subbasins = [(sb_a, sb_b)[i % 2] for i in range(n)]
+    return lambda: rational.route_sbs_at_dp(subbasins)
+
+
+def case_route_arrays(n):
+    rng = _rng()
+    tc = rng.uniform(5, 60, n)
+    ca = rng.uniform(0.1, 10, (n, len(P1)))
+    p1 = np.array(list(P1.values()))
+    return lambda: rational.route_arrays(tc, ca, p1)
+
+
+def _pipes(n):
+    rng = _rng()
+    D = rng.choice([1.5, 2.0, 3.0, 4.0], n)
+    slope = rng.uniform(0.005, 0.05, n)
+    manning_n = np.full(n, 0.013)
+    Q = conduits.circ_full_Q(D, slope, manning_n) * rng.uniform(0.05, 1.0, n)
+    return Q, D, slope, manning_n
+
+
+def _scalar_calls(func, *columns):
+    # One call per row. scipy's bounded Powell search raises on a few percent of circular
+    # pipe inputs; those rows still cost their time and are counted as NaN
+    out = []
+    for args in zip(*columns):
+        try:
+            out.append(func(*args))
+        except ValueError:
+            out.append(np.nan)
+    return out
+
+
+def case_circ_scipy(n):
+    Q, D, slope, manning_n = _pipes(n)
+    return lambda: _scalar_calls(conduits.circ_normal_given_Q, Q, D, slope, manning_n)
+
+
+def case_circ_vector(n):
+    Q, D, slope, manning_n = _pipes(n)
+    return lambda: conduits.circ_normal_depth(Q, D, slope, manning_n)
+
+
+def _channels(n):
+    rng = _rng()
+    return rng.uniform(1, 500, n), rng.uniform(2, 20, n), rng.uniform(0.001, 0.05, n), np.full(n, 0.012)
+
+
+def case_rect_scipy(n):
+    Q, b, slope, manning_n = _channels(n)
+    return lambda: _scalar_calls(conduits.rect_normal_given_Q, Q, b, slope, manning_n)
+
+
+def case_rect_vector(n):
+    Q, b, slope, manning_n = _channels(n)
+    return lambda: conduits.rect_normal_depth(Q, b, slope, manning_n)
+
+
+def case_horton(n):
+    rng = _rng()
+    f0, fi, alpha = rng.uniform(0.5, 1, n), rng.uniform(3, 5, n), rng.uniform(0.0007, 0.0018, n)
+    t = rng.uniform(0, 7200, n)
+    return lambda: cuhp.horton_t(f0, fi, alpha, t)
+
+
+# (name, case, largest size to run)
+CASES = [
+    ("get_c_inflitration", case_c_scalar, 100_000),
+    ("get_c_array", case_c_array, 1_000_000),
+    ("SubBasin", case_subbasin, 1_000),
+    ("BasinTable", case_basin_table, 1_000_000),
+    ("route_sbs_at_dp", case_route_sbs, 1_000_000),
+    ("route_arrays", case_route_arrays, 1_000_000),
+    ("circ_normal_given_Q", case_circ_scipy, 1_000),
+    ("circ_normal_depth", case_circ_vector, 1_000_000),
+    ("rect_normal_given_Q", case_rect_scipy, 1_000),
+    ("rect_normal_depth", case_rect_vector, 1_000_000),
+    ("horton_t", case_horton, 1_000_000),
+]
+
+
+def time_case(run, repeat: int, budget_s: float = 2.0) -> float:
+    # Best wall time of up to `repeat` calls, stopping early once the budget is spent
+    best = np.inf
+    spent = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent > budget_s:
+            break
+    return best
+
+
+def run_benchmarks(sizes=SIZES, repeat: int = 5, only=None) -> dict:
+    # {"name@n": inputs per second}
+    results = {}
+    for name, case, max_size in CASES:
+        if only and name not in only:
+            continue
+        for n in sizes:
+            if n > max_size:
+                continue
+            seconds = time_case(case(n), repeat)
+            results[f"{name}@{n}"] = n / seconds
+            print(f"{name:<22}{n:>10,d}{seconds * 1e3:>12.3f} ms{n / seconds:>16,.0f} /s", flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run's results as the baseline")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="fail instead of skipping the throughput check when there is no baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="allowed fractional throughput drop vs. the baseline (default: %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="only sizes up to 1k")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="kernel names to run")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    failures = []
+
+    for title, kind, checks in (
+        ("Correctness", "check", _correctness_checks()),
+        ("\nRegression snapshots", "snapshot", _snapshot_checks()),
+    ):
+        print(title)
+        for name, value, reference, rtol in checks:
+            ok = bool(np.isclose(value, reference, rtol=rtol, atol=0.0))
+            print(f"  {'ok  ' if ok else 'FAIL'} {name:<28}{value:>22.12g}  ref {reference:.12g}")
+            if not ok:
+                failures.append(f"{kind}: {name} = {value!r}, expected {reference!r}")
+
+    print("\nImport")
+    seconds, loaded = import_check()
+    print(f"  {'ok  ' if not loaded else 'FAIL'} import {', '.join(CORE_MODULES)}: {seconds * 1e3:.1f} ms")
+    if loaded:
+        failures.append(f"import: numeric core loaded {loaded}")
+
+    print("\nThroughput")
+    sizes = tuple(n for n in SIZES if n <= 1_000) if args.quick else SIZES
+    results = run_benchmarks(sizes, repeat=args.repeat, only=args.only)
+    # Imports per second, so a slower import is a drop like any other kernel
+    results["import_core@1"] = 1.0 / seconds
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    throughput_skipped = False
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+    elif not os.path.exists(args.baseline):
+        print(f"\n  SKIP throughput: no baseline at {args.baseline} (record one with --save-baseline)")
+        if args.require_baseline:
+            failures.append(f"throughput: no baseline at {args.baseline}")
+        throughput_skipped = True
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key, rate in results.items():
+            if key in baseline and rate < baseline[key] * (1.0 - args.tolerance):
+                failures.append(f"throughput: {key} {rate:,.0f}/s vs. baseline {baseline[key]:,.0f}/s")
+
+    if failures:
+        print("\nRegressions:")
+        for line in failures:
+            print(f"  {line}")
+        return 1
+    if throughput_skipped:
+        print("\nCorrectness, snapshot and import checks passed; throughput not checked")
+    else:
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+'''
+Batch runner for whole directories of rational-method projects.
+
+    python cli.py projects/ -o results/ -j 8
+
+Every directory holding a basins file is one project (the given directory itself or its
+immediate subdirectories). Project files, as CSV, Parquet or Excel (first sheet):
+
+    basins         name, Li, Si, Lt, St, K, [tc], [design_point]   (no design_point: "outlet")
+    areas          basin, area_ac, soil_group, impervious_ratio
+    P1             return_period, P1                               (e.g. c002, 0.84)
+    design_points  name, [downstream]                              (optional)
+    pipes          name, design_point, diameter_ft, slope, manning_n, [return_period]   (optional)
+
+Projects are spread over a process pool. Each computes basin discharges (BasinTable), routes
+every design point over all basins upstream of it (the DesignPointNetwork tree, routed with
+route_arrays on the BasinTable columns), and solves the normal depth
+of each pipe for its design point's flow (circ_normal_depth; return_period defaults to the
+largest storm in P1). Results are written as consolidated tables with one row per basin /
+design point / pipe across all projects, plus per-project timing and errors.
+'''
+
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import conduits
+import loaders
+from network import DesignPointNetwork
+from rational import RETURN_PERIODS, BasinTable, route_arrays
+
+TABLE_EXTENSIONS = (".csv", ".parquet", ".pq", ".xlsx", ".xlsm")
+DEFAULT_DESIGN_POINT = "outlet"
+
+
+def find_table(directory: str, stem: str):
+    # Path of <stem>.<ext> in directory (case-insensitive stem), or None
+    for entry in sorted(os.listdir(directory)):
+        base, ext = os.path.splitext(entry)
+        if base.lower() == stem.lower() and ext.lower() in TABLE_EXTENSIONS:
+            return os.path.join(directory, entry)
+    return None
+
+
+def find_projects(roots: list[str]) -> list[str]:
+    projects = []
+    for root in roots:
+        if find_table(root, "basins"):
+            projects.append(root)
+            continue
+        for entry in sorted(os.listdir(root)):
+            path = os.path.join(root, entry)
+            if os.path.isdir(path) and find_table(path, "basins"):
+                projects.append(path)
+    return projects
+
+
+def read_table(path: str, headers: list[str], required=()) -> dict:
+    # {header: np.ndarray} of whichever headers the file has (all chunks concatenated)
+    parts = {}
+    for chunk in loaders.iter_table_chunks(path, headers):
+        for header, values in chunk.items():
+            parts.setdefault(header, []).append(values)
+    missing = [h for h in required if h not in parts]
+    if missing:
+        raise ValueError(f"{os.path.basename(path)}: missing columns {missing}")
+    return {header: np.concatenate(values) for header, values in parts.items()}
+
+
+# One project ------------------------------------------------------------------------------------
+
+def _labels(values, default=None) -> np.ndarray:
+    # Column of names as str, with blank cells (None from Excel, NaN from CSV, "") as default
+    return np.array(
+        [default if v is None or v != v or str(v).strip() == "" else str(v) for v in values],
+        dtype=object,
+    )
+
+
+def _design_point_network(basin_dp, dp_table, P1_dict) -> DesignPointNetwork:
+    # Design points from the design_points table plus any only named by basins. The network
+    # checks for unknown downstream points and cycles as the links are made
+    network = DesignPointNetwork(P1_dict)
+    downstream = {}
+    if dp_table is not None:
+        names = _labels(dp_table["name"])
+        below = _labels(dp_table.get("downstream", np.full(len(names), None, dtype=object)))
+        downstream = dict(zip(names, below))
+    for name in [*downstream, *basin_dp]:
+        if name not in network.design_points:
+            network.add_design_point(name)
+    for name, down in downstream.items():
+        if down is not None:
+            if down not in network.design_points:
+                raise ValueError(f'Design point "{name}" drains to unknown design point "{down}"')
+            network.connect(name, down)
+    return network
+
+
+def run_project(directory: str) -> dict:
+    """
+    Compute one project directory.
+
+    Returns
+    -------
+    dict
+        {"project", "seconds", "error", "basins", "design_points", "pipes"}; the last three are
+        {column: list} tables (None when the project failed).
+    """
+    project = os.path.basename(os.path.normpath(directory))
+    start = time.perf_counter()
+    try:
+        p1_path = find_table(directory, "P1")
+        areas_path = find_table(directory, "areas")
+        if p1_path is None or areas_path is None:
+            raise ValueError("Project needs basins, areas and P1 files")
+        p1 = read_table(p1_path, ["return_period", "P1"], required=("return_period", "P1"))
+        P1_dict = dict(zip(p1["return_period"].astype(str), p1["P1"].astype(float)))
+        unknown = [key for key in P1_dict if key not in RETURN_PERIODS]
+        if unknown:
+            raise ValueError(f"Unknown return periods in P1: {unknown}")
+
+        basins_path = find_table(directory, "basins")
+        basins = loaders.load_basins(basins_path)
+        areas = loaders.load_areas(areas_path, basins["name"])
+        # A basin with no area records would only give NaN discharges
+        no_areas = basins["name"][np.bincount(areas.column("basin_idx"), minlength=len(basins["name"])) == 0]
+        if no_areas.size:
+            raise ValueError(f"Basins without areas: {no_areas[:10].tolist()}")
+        table = BasinTable.from_area_array(
+            basins["name"], basins["Li"], basins["Si"], basins["Lt"], basins["St"], basins["K"],
+            areas, P1_dict, tc=basins["tc"],
+        )
+        basin_rows = {"project": [project] * len(table), "basin": table.names.tolist()}
+        for column, values in table.to_dataframe().reset_index(drop=True).items():
+            basin_rows[column] = values.tolist()
+
+        # Design-point routing
+        dp_col = read_table(basins_path, ["design_point"]).get("design_point")
+        if dp_col is None:
+            dp_col = np.full(len(table), None, dtype=object)
+        basin_dp = _labels(dp_col, DEFAULT_DESIGN_POINT)
+        dp_path = find_table(directory, "design_points")
+        dp_table = read_table(dp_path, ["name", "downstream"], required=("name",)) if dp_path else None
+        network = _design_point_network(basin_dp, dp_table, P1_dict)
+        local = {name: np.flatnonzero(basin_dp == name) for name in network.design_points}
+
+        p1_values = np.array(list(P1_dict.values()), dtype=float)
+        ca = table.basin_area_ac[:, None] * table.c[:, [RETURN_PERIODS.index(key) for key in P1_dict]]
+        dp_rows = {"project": [], "design_point": [], "downstream": [], "basin_count": []}
+        for key in P1_dict:
+            dp_rows[f"Q_{key}"] = []
+            dp_rows[f"tc_{key}"] = []
+        dp_q = {}
+        for name, dp in network.design_points.items():
+            idx = np.sort(np.concatenate([local[node] for node in network.upstream_points(name)]))
+            if idx.size:
+                q, tc, _ = route_arrays(table.tc[idx], ca[idx], p1_values)
+            else:
+                q, tc = np.zeros(len(P1_dict)), np.full(len(P1_dict), np.nan)
+            dp_q[name] = dict(zip(P1_dict, q))
+            dp_rows["project"].append(project)
+            dp_rows["design_point"].append(name)
+            dp_rows["downstream"].append(dp.downstream)
+            dp_rows["basin_count"].append(int(idx.size))
+            for j, key in enumerate(P1_dict):
+                dp_rows[f"Q_{key}"].append(float(q[j]))
+                dp_rows[f"tc_{key}"].append(float(tc[j]))
+
+        # Pipe checks
+        pipe_rows = None
+        pipes_path = find_table(directory, "pipes")
+        if pipes_path is not None:
+            pipes = read_table(
+                pipes_path,
+                ["name", "design_point", "diameter_ft", "slope", "manning_n", "return_period"],
+                required=("name", "design_point", "diameter_ft", "slope", "manning_n"),
+            )
+            names = pipes["name"].astype(str)
+            pipe_dp = pipes["design_point"].astype(str)
+            rp = pipes.get("return_period")
+            rp = np.full(len(names), list(P1_dict)[-1], dtype=object) if rp is None else rp.astype(str)
+            bad = [f"{n} ({d}, {r})" for n, d, r in zip(names, pipe_dp, rp) if d not in dp_q or r not in P1_dict]
+            if bad:
+                raise ValueError(f"Pipes reference unknown design points / return periods: {bad[:10]}")
+
+            Q = np.array([dp_q[d][r] for d, r in zip(pipe_dp, rp)], dtype=float)
+            D = pipes["diameter_ft"].astype(float)
+            slope = pipes["slope"].astype(float)
+            manning_n = pipes["manning_n"].astype(float)
+            depth, converged = conduits.circ_normal_depth(Q, D, slope, manning_n)
+            capacity = conduits.circ_full_Q(D, slope, manning_n)
+            pipe_rows = {
+                "project": [project] * len(names),
+                "pipe": names.tolist(),
+                "design_point": pipe_dp.tolist(),
+                "return_period": rp.tolist(),
+                "Q_cfs": Q.tolist(),
+                "diameter_ft": D.tolist(),
+                "capacity_cfs": capacity.tolist(),
+                "depth_ft": depth.tolist(),
+                "depth_ratio": (depth / D).tolist(),
+                "surcharged": (~converged).tolist(),
+            }
+
+        return {
+            "project": project,
+            "seconds": time.perf_counter() - start,
+            "error": None,
+            "basins": basin_rows,
+            "design_points": dp_rows,
+            "pipes": pipe_rows,
+        }
+    except Exception:
+        return {
+            "project": project,
+            "seconds": time.perf_counter() - start,
+            "error": traceback.format_exc(limit=3),
+            "basins": None,
+            "design_points": None,
+            "pipes": None,
+        }
+
+
+# Batch ------------------------------------------------------------------------------------------
+
+def run_batch(projects: list[str], workers: int = None, progress=None) -> list[dict]:
+    # run_project for every directory across a process pool; results in input order
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(projects) == 1:
+        results = []
+        for i, directory in enumerate(projects):
+            results.append(run_project(directory))
+            if progress is not None:
+                progress(i + 1, len(projects), results[-1])
+        return results
+
+    results = [None] * len(projects)
+    with ProcessPoolExecutor(max_workers=min(workers, len(projects))) as pool:
+        futures = {pool.submit(run_project, directory): i for i, directory in enumerate(projects)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(done, len(projects), results[futures[future]])
+    return results
+
+
+def _write_frame(frame, path: str, fmt: str):
+    if fmt == "csv":
+        frame.to_csv(path, index=False)
+    else:
+        from results_io import write_columns
+
+        write_columns(path, {column: frame[column].to_numpy() for column in frame.columns})
+
+
+def write_results(results: list[dict], out_dir: str, fmt: str = "csv") -> dict:
+    # Consolidated tables (basins, design_points, pipes, timing) as CSV or Parquet;
+    # returns {table: path}
+    import pandas as pd
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for table in ("basins", "design_points", "pipes"):
+        frames = [pd.DataFrame(r[table]) for r in results if r[table] is not None]
+        if frames:
+            written[table] = os.path.join(out_dir, f"{table}.{fmt}")
+            _write_frame(pd.concat(frames, ignore_index=True), written[table], fmt)
+
+    timing = pd.DataFrame({
+        "project": [r["project"] for r in results],
+        "seconds": [r["seconds"] for r in results],
+        "status": ["ok" if r["error"] is None else "failed" for r in results],
+        # Last traceback line (the exception); the full text is printed by main()
+        "error": [r["error"].strip().splitlines()[-1] if r["error"] else "" for r in results],
+    })
+    written["timing"] = os.path.join(out_dir, f"timing.{fmt}")
+    _write_frame(timing, written["timing"], fmt)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("roots", nargs="+", help="project directories, or directories of projects")
+    parser.add_argument("-o", "--output", default="results", help="output directory (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument(
+        "-f", "--format", choices=("csv", "parquet"), default="csv", help="output tables (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    projects = find_projects(args.roots)
+    if not projects:
+        print("No project directories found (each needs a basins file)", file=sys.stderr)
+        return 2
+
+    def progress(done, total, result):
+        status = "ok" if result["error"] is None else "FAILED"
+        print(f"[{done}/{total}] {result['project']}: {status} in {result['seconds']:.2f} s", file=sys.stderr)
+
+    start = time.perf_counter()
+    results = run_batch(projects, workers=args.workers, progress=progress)
+    written = write_results(results, args.output, args.format)
+
+    failed = [r for r in results if r["error"] is not None]
+    for r in failed:
+        print(f"\n{r['project']} failed:\n{r['error']}", file=sys.stderr)
+    print(
+        f"{len(results) - len(failed)} of {len(results)} projects in {time.perf_counter() - start:.1f} s; "
+        f"results in {', '.join(written.values())}",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
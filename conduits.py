@@ -1,7 +1,31 @@
+import time
+from functools import lru_cache
+
 import numpy as np
-from scipy.optimize import minimize
-from matplotlib import pyplot as plt
-import matplotlib.patches as patches
+
+# scipy (the scalar reference solvers) and matplotlib (plotting) are imported inside the
+# functions that use them, so importing this module for the vectorized solvers stays fast
+# in CLI runs and process-pool workers. benchmarks.py checks that this stays true.
+
+# Optional diagnostics hook, called once per solver call as hook(solver_name, info_dict) with
+#   seconds     wall time of the call
+#   n           number of pipes / channels solved
+#   nfev        objective (or residual) evaluations, summed over the array
+#   iterations  optimizer / Newton iterations (the most any element needed for array solvers)
+#   residual    largest final residual
+#   converged   number of elements that converged
+# Left as None nothing is reported (or timed) and the only cost is an `is None` check.
+# instrumentation.SolverStats collects these into a summary table.
+_solver_hook = None
+
+
+def set_solver_hook(hook):
+    # Install (or clear, with None) the diagnostics hook; returns the previous one
+    global _solver_hook
+    previous = _solver_hook
+    _solver_hook = hook
+    return previous
+
 
 class Circular_Pipe():
 
@@ -10,6 +34,28 @@ class Circular_Pipe():
         self.slope = slope
         self.mannings_n = mannings_n
         self.max_Q = circ_full_Q(D=diameter, slope=slope, manning_n=mannings_n)
+        self.max_V = self.max_Q / (np.pi / 4 * diameter**2)
+
+    # O(1) lookups from the dimensionless partial-flow table (see partial_flow_table for the
+    # error bound against circ_normal_depth / the exact Manning equation)
+    def Q_from_depth(self, depth):
+        return self.max_Q * partial_flow_ratios(np.asarray(depth) / self.diameter)[0]
+
+    def velocity_from_depth(self, depth):
+        return self.max_V * partial_flow_ratios(np.asarray(depth) / self.diameter)[1]
+
+    def depth_from_Q(self, Q):
+        # Lower-branch normal depth; NaN above the pipe's maximum (not full) capacity
+        return self.diameter * depth_ratio_from_Q_ratio(np.asarray(Q) / self.max_Q)
+
+def water_level_label(depth, Q, Q_max):
+    # Caption under a water-level figure (shared with pipe_figures' batch renderer)
+    depth, Q, Q_max = (float(np.squeeze(v)) for v in (depth, Q, Q_max))
+    return (
+        f"Given flow: {Q:.2f} cfs\n"
+        f"Normal depth in the pipe: {depth:.3f} ft\n"
+        f"Max flow in the pipe: {Q_max:.2f} cfs"
+    )
 
 def plot_pipe_water_level(depth, diameter, Q, Q_max):
     """
@@ -30,6 +76,8 @@ def plot_pipe_water_level(depth, diameter, Q, Q_max):
     # y_list-coordinate of converted depth
     depth_y = -R + water_depth # y_list-location of the water line
 
+    from matplotlib import pyplot as plt
+
     # Prepare figure
     fig, ax = plt.subplots(figsize=(6, 6))
 
@@ -58,10 +106,8 @@ def plot_pipe_water_level(depth, diameter, Q, Q_max):
     #         color='blue', linewidth=2)
     ax.plot(x_line, depth_y * np.ones_like(x_line), color='blue', linewidth=2)
 
-    Label_str =(
-        f"""Given flow: {Q} cfs\n
-        Normal depth in the pipe: {depth} ft.
-        Max Flow in the pipe: {Q_max} cfs""")
+    Label_str = water_level_label(depth, Q, Q_max)
+    fig.text(0.5, 0.04, Label_str, ha='center', va='bottom')
 
 
     # Formatting
@@ -84,7 +130,6 @@ def rect_normal_given_Q(
         p = b + (2 * y)
         rh = a/p
         error = abs(Q - (1.49 / manning_n * a * np.pow(rh, 2/3) * np.sqrt(slope)))
-        print(f'Error in the rectangular channel calc = {error}')
         return error
 
     y_0 = 0.2981
@@ -95,10 +140,124 @@ def rect_normal_given_Q(
 
     # y_q = minimize(easy_one, q_test_0, method='Powell')
 
+    from scipy.optimize import minimize
+
+    start = time.perf_counter() if _solver_hook is not None else 0.0
     y_q = minimize(Q_error, y_0, method='SLSQP')
+    if _solver_hook is not None:
+        _report_scipy("rect_normal_given_Q", start, y_q)
 
     return y_q.x
 
+
+def _report_scipy(name, start, result):
+    # Hook record for one scipy.optimize.minimize call
+    _solver_hook(name, {
+        "seconds": time.perf_counter() - start,
+        "n": 1,
+        "nfev": int(result.nfev),
+        "iterations": int(getattr(result, "nit", 0)),
+        "residual": float(result.fun),
+        "converged": int(bool(result.success)),
+    })
+
+def _rect_log_Q(y, b, slope, manning_n):
+    # log of Manning's Q for a rectangular section of width b at depth y
+    return np.log(1.49 / manning_n * np.sqrt(slope)) + 5/3 * np.log(b * y) - 2/3 * np.log(b + 2 * y)
+
+
+def rect_normal_depth(
+    Q,
+    b,
+    slope,
+    manning_n,
+    tol: float = 1e-12,
+    max_iter: int = 100,
+):
+    """
+    Normal depth in rectangular channels, solved for whole arrays of reaches at once.
+
+    The wide-channel depth (R = y) always underestimates the real depth, so it is both the
+    starting guess and the lower end of the bracket. The upper end is found by doubling, which
+    always terminates because Q grows without bound with y. Newton steps on log(Q) are kept
+    inside the bracket, falling back to bisection.
+
+    Parameters
+    ----------
+    Q, b, slope, manning_n : float or array-like
+        Flow (cfs), bottom width (ft), slope (ft/ft) and Manning's n. Broadcast together.
+    tol : float
+        Relative tolerance on depth (or on the log of the flow residual).
+    max_iter : int
+        Iteration cap for the Newton solve.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Normal depth (ft) and a converged mask (NaN depth where not converged).
+    """
+    start = time.perf_counter() if _solver_hook is not None else 0.0
+    Q, b, slope, manning_n = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (Q, b, slope, manning_n))
+    )
+    shape = Q.shape
+    Q, b, slope, manning_n = (v.ravel() for v in (Q, b, slope, manning_n))
+
+    y = np.zeros(Q.shape)
+    converged = Q == 0
+    active = (Q > 0) & np.isfinite(Q)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_q = np.log(Q)
+
+    # Wide-channel approximation: Q = 1.49/n * b * y^(5/3) * sqrt(S)
+    lo = np.where(active, np.pow(Q * manning_n / (1.49 * b * np.sqrt(slope)), 3/5), 0.0)
+    hi = lo.copy()
+    grow = active.copy()
+    while grow.any():
+        hi[grow] *= 2
+        grow[grow] = _rect_log_Q(hi[grow], b[grow], slope[grow], manning_n[grow]) < log_q[grow]
+    y[active] = lo[active]
+
+    iterations = 0
+    nfev = 0
+    residual = np.zeros(Q.shape)
+    idx = np.flatnonzero(active)
+    for iterations in range(1, max_iter + 1):
+        if idx.size == 0:
+            break
+        yi, bi = y[idx], b[idx]
+        f = _rect_log_Q(yi, bi, slope[idx], manning_n[idx]) - log_q[idx]
+        nfev += idx.size
+        residual[idx] = np.abs(f)
+
+        below = f < 0
+        lo[idx] = np.where(below, yi, lo[idx])
+        hi[idx] = np.where(below, hi[idx], yi)
+
+        y_new = yi - f / (5 / (3 * yi) - 4 / (3 * (bi + 2 * yi)))
+        bad = ~np.isfinite(y_new) | (y_new < lo[idx]) | (y_new > hi[idx])
+        y_new = np.where(bad, 0.5 * (lo[idx] + hi[idx]), y_new)
+        solved = np.abs(f) <= tol
+        y_new = np.where(solved, yi, y_new)
+        y[idx] = y_new
+
+        done = solved | (np.abs(y_new - yi) <= tol * yi)
+        converged[idx[done]] = True
+        idx = idx[~done]
+
+    y[~converged] = np.nan
+    if _solver_hook is not None:
+        _solver_hook("rect_normal_depth", {
+            "seconds": time.perf_counter() - start,
+            "n": Q.size,
+            "nfev": nfev,
+            "iterations": iterations,
+            "residual": float(residual.max(initial=0.0)),
+            "converged": int(converged.sum()),
+        })
+    return y.reshape(shape), converged.reshape(shape)
+
+
 def circ_normal_given_Q(
     Q: float,
     D: float,
@@ -106,12 +265,9 @@ def circ_normal_given_Q(
     manning_n: float,
 ):
     # NOTE: numpy trig funcitons use radians by default
-    # find theta
-    debug=True
+    # find theta (trial values stay inside the bounds below; convergence is reported via
+    # the solver hook instead of printing from the objective)
     def theta_error(theta):
-        if theta < 0:
-            print(f"THETA: {theta}")
-            print(f"NEGATIVE VALUE IN TRIAL: theta = {theta}")
         # https://www.engr.scu.edu/~emaurer/hydr-watres-book/flow-in-open-channels.html
         c = 13.53 # English units
         error = np.pow(theta, -2/3) \
@@ -122,7 +278,12 @@ def circ_normal_given_Q(
     theta_0 = 1
     bounds=((0, 2*np.pi),)
 
+    from scipy.optimize import minimize
+
+    start = time.perf_counter() if _solver_hook is not None else 0.0
     theta_q = minimize(theta_error, theta_0, method='Powell', bounds=bounds)
+    if _solver_hook is not None:
+        _report_scipy("circ_normal_given_Q", start, theta_q)
 
     y = D / 2 * (1 - np.cos(theta_q.x/2))
 
@@ -139,6 +300,296 @@ def circ_full_Q(
     return 1.49/manning_n * a * np.pow(rh, 2/3) * np.sqrt(slope)
 
 
+# Vectorized circular normal depth ------------------------------------------------------------------
+# Manning in terms of the wetted angle theta (radians):
+#   Q = 1.49/n * D^(8/3) / 2^(13/3) * theta^(-2/3) * (theta - sin(theta))^(5/3) * sqrt(S)
+# so the solve is g(theta) = theta^(-2/3) * (theta - sin(theta))^(5/3) = K with
+#   K = 2^(13/3) * n * Q / (1.49 * D^(8/3) * sqrt(S))
+# (2^(13/3) / 1.49 is the 13.53 used in circ_normal_given_Q). g peaks just below full flow, so
+# only the lower branch theta in (0, _THETA_QMAX] is a normal depth.
+
+def _theta_minus_sin(theta):
+    # theta - sin(theta) without the cancellation for small angles
+    small = theta < 1e-2
+    t2 = theta * theta
+    series = theta * t2 / 6 * (1 - t2 / 20 * (1 - t2 / 42))
+    return np.where(small, series, theta - np.sin(theta))
+
+
+def _log_g(theta):
+    return 5/3 * np.log(_theta_minus_sin(theta)) - 2/3 * np.log(theta)
+
+
+def _dlog_g(theta):
+    # d/dtheta of _log_g; 1 - cos written as 2 sin^2 to stay accurate near zero
+    return 5/3 * 2 * np.sin(theta / 2)**2 / _theta_minus_sin(theta) - 2 / (3 * theta)
+
+
+def _find_theta_qmax():
+    # Root of d(log g)/dtheta on the upper half of the circle (flow peaks at y/D ~ 0.938)
+    lo, hi = np.pi, 2 * np.pi - 1e-9
+    for _ in range(100):
+        mid = 0.5 * (lo + hi)
+        if _dlog_g(mid) > 0:
+            lo = mid
+        else:
+            hi = mid
+    return 0.5 * (lo + hi)
+
+
+_THETA_QMAX = _find_theta_qmax()
+_LOG_G_MAX = float(_log_g(_THETA_QMAX))
+
+
+def _circ_theta_given_Q(Q, D, slope, manning_n, tol=1e-12, max_iter=100):
+    # Bracketed Newton on log(g(theta)) - log(K) for every pipe at once.
+    # Returns theta, converged mask, iterations used, final |log residual| and the number of
+    # residual evaluations
+    Q, D, slope, manning_n = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (Q, D, slope, manning_n))
+    )
+    shape = Q.shape
+    K = (2**(13/3) * manning_n * Q / (1.49 * np.pow(D, 8/3) * np.sqrt(slope))).ravel()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_k = np.log(K)
+
+    theta = np.zeros(K.shape)
+    residual = np.zeros(K.shape)
+    converged = K == 0
+    # Above the peak of g there is no normal depth (flow exceeds the pipe's capacity)
+    active = np.isfinite(log_k) & (log_k <= _LOG_G_MAX)
+
+    lo = np.full(K.shape, 0.0)
+    hi = np.full(K.shape, _THETA_QMAX)
+    # Small-angle asymptote g ~ theta^(13/3) / 6^(5/3) is a good start across the whole range
+    theta[active] = np.minimum(np.pow(K[active] * 6**(5/3), 3/13), 0.99 * _THETA_QMAX)
+
+    iterations = 0
+    nfev = 0
+    idx = np.flatnonzero(active)
+    for iterations in range(1, max_iter + 1):
+        if idx.size == 0:
+            break
+        t = theta[idx]
+        f = _log_g(t) - log_k[idx]
+        nfev += idx.size
+        residual[idx] = np.abs(f)
+
+        below = f < 0
+        lo[idx] = np.where(below, t, lo[idx])
+        hi[idx] = np.where(below, hi[idx], t)
+
+        t_new = t - f / _dlog_g(t)
+        # Fall back to bisection whenever Newton leaves the bracket
+        bad = ~np.isfinite(t_new) | (t_new < lo[idx]) | (t_new > hi[idx])
+        t_new = np.where(bad, 0.5 * (lo[idx] + hi[idx]), t_new)
+        # A point that already satisfies the equation is kept as is
+        solved = residual[idx] <= tol
+        t_new = np.where(solved, t, t_new)
+        theta[idx] = t_new
+
+        done = solved | (np.abs(t_new - t) <= tol * t)
+        converged[idx[done]] = True
+        idx = idx[~done]
+
+    theta[~converged] = np.nan
+    return theta.reshape(shape), converged.reshape(shape), iterations, residual.reshape(shape), nfev
+
+
+def circ_normal_depth(
+    Q,
+    D,
+    slope,
+    manning_n,
+    tol: float = 1e-12,
+    max_iter: int = 100,
+):
+    """
+    Normal depth in circular pipes, solved for whole arrays of pipes at once.
+
+    Parameters
+    ----------
+    Q, D, slope, manning_n : float or array-like
+        Flow (cfs), diameter (ft), slope (ft/ft) and Manning's n. Broadcast together.
+    tol : float
+        Relative tolerance on the wetted angle (or on the log of the flow residual).
+    max_iter : int
+        Iteration cap for the bracketed Newton solve.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Normal depth (ft) and a converged mask. Pipes that don't converge, including flows above
+        the pipe's maximum (just below full) capacity, get NaN depth and False.
+    """
+    start = time.perf_counter() if _solver_hook is not None else 0.0
+    theta, converged, iterations, residual, nfev = _circ_theta_given_Q(
+        Q, D, slope, manning_n, tol=tol, max_iter=max_iter
+    )
+    D = np.broadcast_to(np.asarray(D, dtype=float), theta.shape)
+    y = D / 2 * (1 - np.cos(theta / 2))
+    if _solver_hook is not None:
+        _solver_hook("circ_normal_depth", {
+            "seconds": time.perf_counter() - start,
+            "n": y.size,
+            "nfev": nfev,
+            "iterations": iterations,
+            "residual": float(residual.max(initial=0.0)),
+            "converged": int(converged.sum()),
+        })
+    return y, converged
+
+
+# Dimensionless partial-flow table ------------------------------------------------------------------
+# For a circular section Q/Q_full and V/V_full depend only on y/D, so one table serves every pipe.
+# The forward table is uniform in the wetted angle theta and the inverse table is uniform in
+# phi = 1 - sqrt(1 - (q/q_max)^(3/13)). Both variables take the square-root / power-law
+# behavior out of the curves at the empty and near-full ends, so plain linear interpolation
+# (monotone-preserving) stays accurate everywhere. Lookups index the uniform grid directly.
+
+_PARTIAL_FLOW_POINTS = 4097
+
+
+@lru_cache(maxsize=None)
+def partial_flow_table(points: int = _PARTIAL_FLOW_POINTS):
+    """
+    Build (once per size) the dimensionless circular partial-flow table.
+
+    With the default 4097 points the interpolation error against the exact solution is below
+    1e-7 in Q/Q_full, 6e-6 in V/V_full and 2e-7 in y/D (checked against circ_normal_depth over
+    the whole range, including the ends).
+
+    Returns
+    -------
+    dict
+        "theta", "q_ratio", "v_ratio": forward table, uniform in theta on [0, 2*pi].
+        "phi_theta": theta on the inverse grid, uniform in phi on [0, 1].
+        "q_ratio_max": largest Q/Q_full (at y/D ~ 0.938).
+    """
+    theta = np.linspace(0, 2 * np.pi, points)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        q_ratio = np.exp(_log_g(theta)) / (2 * np.pi)
+        v_ratio = np.pow(_theta_minus_sin(theta) / theta, 2/3)
+    q_ratio[0] = 0.0
+    v_ratio[0] = 0.0
+
+    q_ratio_max = float(np.exp(_LOG_G_MAX) / (2 * np.pi))
+    phi = np.linspace(0, 1, points)
+    q_inverse = q_ratio_max * np.pow(1 - (1 - phi)**2, 13/3)
+    # Q_ratio -> K for a unit pipe: K = 2*pi * q when D = S = 1 and n = 1.49 / 2^(13/3)
+    phi_theta, _, _, _, _ = _circ_theta_given_Q(2 * np.pi * q_inverse, 1.0, 1.0, 1.49 / 2**(13/3))
+    phi_theta[-1] = _THETA_QMAX
+
+    return {
+        "theta": theta,
+        "q_ratio": q_ratio,
+        "v_ratio": v_ratio,
+        "phi_theta": phi_theta,
+        "q_ratio_max": q_ratio_max,
+    }
+
+
+def _uniform_lookup(x, x_max, values):
+    # Linear interpolation on a uniform grid over [0, x_max]: direct index, no search
+    n = len(values)
+    pos = np.clip(np.asarray(x, dtype=float) / x_max, 0.0, 1.0) * (n - 1)
+    i = np.minimum(pos.astype(np.intp), n - 2)
+    frac = pos - i
+    return values[i] + frac * (values[i + 1] - values[i])
+
+
+def partial_flow_ratios(depth_ratio):
+    # (Q/Q_full, V/V_full) for y/D values (clipped to [0, 1])
+    table = partial_flow_table()
+    theta = 2 * np.arccos(1 - 2 * np.clip(depth_ratio, 0.0, 1.0))
+    return (
+        _uniform_lookup(theta, 2 * np.pi, table["q_ratio"]),
+        _uniform_lookup(theta, 2 * np.pi, table["v_ratio"]),
+    )
+
+
+def depth_ratio_from_Q_ratio(q_ratio):
+    # Normal depth y/D for Q/Q_full values; NaN above the maximum ratio (~1.076)
+    table = partial_flow_table()
+    q_ratio = np.asarray(q_ratio, dtype=float)
+    w = np.pow(np.clip(q_ratio / table["q_ratio_max"], 0.0, 1.0), 3/13)
+    theta = _uniform_lookup(1 - np.sqrt(1 - w), 1.0, table["phi_theta"])
+    return np.where(q_ratio <= table["q_ratio_max"], (1 - np.cos(theta / 2)) / 2, np.nan)
+
+
+# Storm sewer sizing ---------------------------------------------------------------------------------
+
+# Nominal round pipe sizes (inches) tried by size_circular_pipes, smallest first
+STANDARD_PIPE_DIAMETERS_IN = (
+    12, 15, 18, 21, 24, 27, 30, 33, 36, 42, 48, 54, 60, 66, 72, 78, 84, 90, 96, 102, 108, 114, 120
+)
+
+
+def size_circular_pipes(
+    Q,
+    slope,
+    manning_n,
+    diameters_in=STANDARD_PIPE_DIAMETERS_IN,
+    max_Q_ratio: float = 1.0,
+    max_depth_ratio: float = None,
+):
+    """
+    Pick the smallest catalogue diameter for every pipe in one broadcast pass.
+
+    Parameters
+    ----------
+    Q, slope, manning_n : float or array-like
+        Design flow (cfs, e.g. from SubBasin.discharge_dict), slope (ft/ft) and Manning's n.
+    diameters_in : sequence of float
+        Candidate diameters in inches, in increasing order.
+    max_Q_ratio : float
+        Largest allowed Q / Q_full (1.0 = flowing full capacity).
+    max_depth_ratio : float, optional
+        Largest allowed normal depth y/D; converted to its Q / Q_full through the
+        partial-flow table and combined with max_Q_ratio.
+
+    Returns
+    -------
+    dict of np.ndarray
+        diameter_in, diameter_ft, capacity_cfs (full flow), depth_ft, depth_ratio,
+        velocity_fps and sized (False where no catalogue size is big enough; NaN elsewhere).
+    """
+    Q, slope, manning_n = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (Q, slope, manning_n))
+    )
+    diameters_in = np.asarray(diameters_in, dtype=float)
+    diameters_ft = diameters_in / 12
+
+    limit = max_Q_ratio
+    if max_depth_ratio is not None:
+        limit = min(limit, float(partial_flow_ratios(max_depth_ratio)[0]))
+
+    # (..., n_sizes) capacity of every candidate for every pipe
+    capacity = circ_full_Q(D=diameters_ft, slope=slope[..., None], manning_n=manning_n[..., None])
+    fits = Q[..., None] <= limit * capacity
+    first = np.argmax(fits, axis=-1)
+    sized = fits.any(axis=-1)
+
+    D = np.where(sized, diameters_ft[first], np.nan)
+    capacity_cfs = np.where(sized, np.take_along_axis(capacity, first[..., None], axis=-1)[..., 0], np.nan)
+    depth, _ = circ_normal_depth(Q, D, slope, manning_n)
+
+    theta = 2 * np.arccos(1 - 2 * depth / D)
+    flow_area = D**2 / 8 * _theta_minus_sin(theta)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        velocity = np.where(Q > 0, Q / flow_area, 0.0)
+
+    return {
+        "diameter_in": np.where(sized, diameters_in[first], np.nan),
+        "diameter_ft": D,
+        "capacity_cfs": capacity_cfs,
+        "depth_ft": depth,
+        "depth_ratio": depth / D,
+        "velocity_fps": np.where(sized, velocity, np.nan),
+        "sized": sized,
+    }
+
+
 if __name__ == "__main__":
     
     # test_basin = SubBasin(
@@ -0,0 +1,141 @@
+'''
+Opt-in timing and convergence statistics for the conduits solvers and rational calculations.
+
+    with SolverStats() as stats:
+        ... run a model ...
+    print(stats.format_table())
+
+While enabled, SolverStats is installed as both conduits' solver hook and rational's calc hook
+and folds every reported call into running per-name counters (calls, elements, wall time,
+function evaluations, iterations, worst residual, non-converged count) plus a log2 histogram
+of per-element time. Nothing is kept per call, so it can stay on for production runs. When no
+collector is installed the hooks cost one `is None` check per call.
+'''
+
+import math
+
+import conduits
+import rational
+
+SUMMARY_COLUMNS = (
+    "name", "calls", "n", "seconds", "us_per_item", "max_call_s",
+    "nfev", "nfev_per_item", "max_iterations", "max_residual", "not_converged",
+)
+
+
+class _Counter:
+    __slots__ = ("calls", "n", "seconds", "max_call_s", "nfev", "max_iterations",
+                 "max_residual", "not_converged", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.n = 0
+        self.seconds = 0.0
+        self.max_call_s = 0.0
+        self.nfev = 0
+        self.max_iterations = 0
+        self.max_residual = 0.0
+        self.not_converged = 0
+        self.histogram = {}
+
+    def add(self, info: dict):
+        n = info.get("n", 1)
+        seconds = info.get("seconds", 0.0)
+        self.calls += 1
+        self.n += n
+        self.seconds += seconds
+        self.max_call_s = max(self.max_call_s, seconds)
+        self.nfev += info.get("nfev", 0)
+        self.max_iterations = max(self.max_iterations, info.get("iterations", 0))
+        residual = info.get("residual", 0.0)
+        if residual > self.max_residual or math.isnan(residual):
+            self.max_residual = residual
+        if "converged" in info:
+            self.not_converged += n - info["converged"]
+        # Bucket b holds calls that took 2^b <= microseconds per element < 2^(b+1)
+        per_item_us = seconds * 1e6 / max(n, 1)
+        bucket = math.frexp(per_item_us)[1] - 1 if per_item_us > 0 else -1
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+
+class SolverStats:
+    def __init__(self):
+        self.counters = {}
+        self._previous = None
+
+    def __call__(self, name: str, info: dict):
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = _Counter()
+        counter.add(info)
+
+    def enable(self):
+        if self._previous is None:
+            self._previous = (conduits.set_solver_hook(self), rational.set_calc_hook(self))
+        return self
+
+    def disable(self):
+        if self._previous is not None:
+            conduits.set_solver_hook(self._previous[0])
+            rational.set_calc_hook(self._previous[1])
+            self._previous = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def reset(self):
+        self.counters.clear()
+
+    def summary(self) -> list[dict]:
+        # One row per solver / calculation, columns as in SUMMARY_COLUMNS
+        rows = []
+        for name, c in sorted(self.counters.items()):
+            rows.append({
+                "name": name,
+                "calls": c.calls,
+                "n": c.n,
+                "seconds": c.seconds,
+                "us_per_item": c.seconds * 1e6 / c.n if c.n else float("nan"),
+                "max_call_s": c.max_call_s,
+                "nfev": c.nfev,
+                "nfev_per_item": c.nfev / c.n if c.n else float("nan"),
+                "max_iterations": c.max_iterations,
+                "max_residual": c.max_residual,
+                "not_converged": c.not_converged,
+            })
+        return rows
+
+    def histogram(self, name: str) -> dict[str, int]:
+        # {"<lower>-<upper> us": calls} of per-element time for one name
+        buckets = self.counters[name].histogram
+        return {
+            ("0 us" if b < 0 else f"{2.0**b:g}-{2.0**(b + 1):g} us"): buckets[b]
+            for b in sorted(buckets)
+        }
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.summary(), columns=SUMMARY_COLUMNS)
+
+    def to_csv(self, path: str):
+        import csv
+
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.summary())
+
+    def format_table(self) -> str:
+        header = ("name", "calls", "n", "seconds", "us/item", "nfev/item", "max iter", "max resid", "failed")
+        lines = [f"{header[0]:<22}" + "".join(f"{h:>12}" for h in header[1:])]
+        for r in self.summary():
+            lines.append(
+                f"{r['name']:<22}{r['calls']:>12,d}{r['n']:>12,d}{r['seconds']:>12.4f}"
+                f"{r['us_per_item']:>12.3f}{r['nfev_per_item']:>12.2f}{r['max_iterations']:>12d}"
+                f"{r['max_residual']:>12.2e}{r['not_converged']:>12,d}"
+            )
+        return "\n".join(lines)
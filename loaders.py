@@ -0,0 +1,163 @@
+'''
+Bulk loading of rational-method inputs from MHFD workbooks and CSV / Parquet tables.
+
+Files are read in chunks of columns (pandas CSV chunks, pyarrow record batches, openpyxl
+read-only rows) and appended straight into column arrays / an AreaArray, so no Area or SubBasin
+object is built per row. load_project returns a BasinTable ready for whole-array calculations.
+
+Column names are mapped through a {field: header} dict so spreadsheet headers like
+"Basin ID" or "Area (ac)" can be used as-is.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from rational import AreaArray, BasinTable, soil_group_codes
+
+BASIN_COLUMNS = {"name": "name", "Li": "Li", "Si": "Si", "Lt": "Lt", "St": "St", "K": "K", "tc": "tc"}
+AREA_COLUMNS = {
+    "basin": "basin",
+    "area_ac": "area_ac",
+    "soil_group": "soil_group",
+    "impervious_ratio": "impervious_ratio",
+}
+# Basin columns that may be left out of a file (filled with NaN)
+OPTIONAL_BASIN_FIELDS = ("tc",)
+
+CHUNK_ROWS = 65536
+
+
+def iter_table_chunks(path: str, headers: list[str], chunk_rows: int = CHUNK_ROWS, sheet: str = None):
+    """
+    Yield {header: np.ndarray} chunks of the requested columns from a CSV, Parquet or Excel file.
+
+    Headers missing from the file are skipped (the caller decides which are required). A file
+    with none of them yields no chunks.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".csv", ".txt"):
+        available = pd.read_csv(path, nrows=0).columns
+        usecols = [h for h in headers if h in available]
+        if not usecols:
+            return
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunk_rows):
+            yield {h: chunk[h].to_numpy() for h in usecols}
+
+    elif ext in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        usecols = [h for h in headers if h in pf.schema_arrow.names]
+        if not usecols:
+            return
+        for batch in pf.iter_batches(batch_size=chunk_rows, columns=usecols):
+            yield {h: batch.column(h).to_numpy(zero_copy_only=False) for h in usecols}
+
+    elif ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet] if sheet is not None else wb.active
+            rows = ws.iter_rows(values_only=True)
+            header_row = next(rows, ())
+            positions = {h: header_row.index(h) for h in headers if h in header_row}
+            if not positions:
+                return
+            buffers = {h: [] for h in positions}
+            for row in rows:
+                if all(v is None for v in row):
+                    continue
+                for h, j in positions.items():
+                    buffers[h].append(row[j] if j < len(row) else None)
+                if len(buffers[next(iter(buffers))]) >= chunk_rows:
+                    yield {h: np.array(v) for h, v in buffers.items()}
+                    buffers = {h: [] for h in positions}
+            if buffers[next(iter(buffers))]:
+                yield {h: np.array(v) for h, v in buffers.items()}
+        finally:
+            wb.close()
+
+    else:
+        raise ValueError(f"Unsupported input file type: {path}")
+
+
+def _require(found, mapping, optional=()):
+    missing = [field for field, header in mapping.items() if header not in found and field not in optional]
+    if missing:
+        raise ValueError(f"Missing columns: {[mapping[f] for f in missing]}")
+
+
+def load_basins(path: str, columns: dict = None, sheet: str = None, chunk_rows: int = CHUNK_ROWS):
+    # Basin table -> {field: np.ndarray}; tc is NaN where not given (automatic tc)
+    mapping = {**BASIN_COLUMNS, **(columns or {})}
+    parts = {field: [] for field in mapping}
+    found = set()
+    for chunk in iter_table_chunks(path, list(mapping.values()), chunk_rows=chunk_rows, sheet=sheet):
+        found.update(chunk)
+        n = len(next(iter(chunk.values())))
+        for field, header in mapping.items():
+            parts[field].append(chunk[header] if header in chunk else np.full(n, np.nan))
+    _require(found, mapping, OPTIONAL_BASIN_FIELDS)
+
+    basins = {field: np.concatenate(v) if v else np.array([]) for field, v in parts.items()}
+    basins["name"] = basins["name"].astype(str)
+    for field in mapping:
+        if field != "name":
+            basins[field] = basins[field].astype(float)
+    if len(np.unique(basins["name"])) != len(basins["name"]):
+        raise ValueError("Basin names must be unique")
+    return basins
+
+
+def load_areas(
+    path: str,
+    basin_names,
+    columns: dict = None,
+    sheet: str = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> AreaArray:
+    # Area table -> AreaArray, with each area's basin name resolved to its row in basin_names
+    mapping = {**AREA_COLUMNS, **(columns or {})}
+    lookup = pd.Index(np.asarray(basin_names, dtype=str))
+    areas = AreaArray()
+    found = set()
+    for chunk in iter_table_chunks(path, list(mapping.values()), chunk_rows=chunk_rows, sheet=sheet):
+        found.update(chunk)
+        _require(found, mapping)
+        basin_idx = lookup.get_indexer(chunk[mapping["basin"]].astype(str))
+        if (basin_idx < 0).any():
+            unknown = np.unique(chunk[mapping["basin"]][basin_idx < 0].astype(str))
+            raise ValueError(f"Areas reference unknown basins: {unknown[:10].tolist()}")
+        areas.extend(
+            basin_idx=basin_idx,
+            area_ac=chunk[mapping["area_ac"]].astype(float),
+            soil_code=soil_group_codes(chunk[mapping["soil_group"]].astype(str)),
+            impervious_ratio=chunk[mapping["impervious_ratio"]].astype(float),
+        )
+    _require(found, mapping)
+    return areas
+
+
+def load_project(
+    basins_path: str,
+    areas_path: str,
+    P1_dict: dict[str, float],
+    basin_columns: dict = None,
+    area_columns: dict = None,
+    basin_sheet: str = None,
+    area_sheet: str = None,
+) -> BasinTable:
+    """
+    Load a whole project (one basin table, one area table) into a BasinTable.
+
+    The two tables may be separate files or two sheets of the same workbook.
+    """
+    basins = load_basins(basins_path, columns=basin_columns, sheet=basin_sheet)
+    areas = load_areas(areas_path, basins["name"], columns=area_columns, sheet=area_sheet)
+    return BasinTable.from_area_array(
+        basins["name"], basins["Li"], basins["Si"], basins["Lt"], basins["St"], basins["K"],
+        areas, P1_dict, tc=basins["tc"],
+    )
@@ -0,0 +1,188 @@
+'''
+Design-point network for rational-method routing.
+
+Sub-basins drain to design points, and each design point drains to (at most) one downstream
+design point. A design point routes every sub-basin upstream of it with route_arrays, the
+same critical-duration logic as rational.route_sbs_at_dp.
+
+Results are cached per design point. Editing a sub-basin only marks its own design point and
+the path below it as dirty, and dirty points are recomputed on the next request, so an
+interactive tc/area tweak costs the affected path instead of a full model rerun. The design
+storm (P1) belongs to the network and is changed for every basin at once with set_P1.
+'''
+
+import numpy as np
+
+from rational import SubBasin, route_arrays
+
+
+class DesignPoint:
+    def __init__(self, name: str, downstream: str = None):
+        self.name = name
+        self.downstream = downstream
+        self.upstream = []      # names of design points draining here
+        self.subbasins = []     # names of sub-basins draining directly here
+        self.dirty = True
+
+        # Cached tc / C*A arrays of the direct sub-basins (rebuilt only when one of them changes)
+        self._local_tc = None
+        self._local_ca = None
+        self._local_names = None
+
+        # Routed results for everything upstream of this point
+        self.q_dict = None
+        self.tc_dict = None
+        self.controlling_basin = None
+
+
+class DesignPointNetwork:
+    def __init__(self, P1_dict: dict[str, float]):
+        self.P1_dict = P1_dict
+        self.design_points = {}
+        self.subbasins = {}
+        self._outlet_of = {}    # sub-basin name -> design point name
+
+    # Building the network ----------------------------------------------------------------------
+
+    def add_design_point(self, name: str, downstream: str = None):
+        if name in self.design_points:
+            raise ValueError(f'Design point "{name}" already exists')
+        # Checked before registering, so a bad name doesn't leave a half-added point behind
+        if downstream is not None and downstream not in self.design_points:
+            raise KeyError(f'Unknown design point "{downstream}"')
+        self.design_points[name] = DesignPoint(name)
+        if downstream is not None:
+            self.connect(name, downstream)
+        return self.design_points[name]
+
+    def connect(self, name: str, downstream: str):
+        # Point design point `name` at `downstream`, refusing anything that would create a loop
+        dp = self.design_points[name]
+        if downstream not in self.design_points:
+            raise KeyError(f'Unknown design point "{downstream}"')
+        node = downstream
+        while node is not None:
+            if node == name:
+                raise ValueError(f'Connecting "{name}" to "{downstream}" would create a cycle')
+            node = self.design_points[node].downstream
+
+        if dp.downstream is not None:
+            old = self.design_points[dp.downstream]
+            old.upstream.remove(name)
+            self._invalidate(old.name)
+        dp.downstream = downstream
+        self.design_points[downstream].upstream.append(name)
+        self._invalidate(name)
+
+    def add_subbasin(self, sb: SubBasin, design_point: str):
+        if sb.name in self.subbasins:
+            raise ValueError(f'Sub-basin "{sb.name}" already exists')
+        dp = self.design_points[design_point]
+        self.subbasins[sb.name] = sb
+        self._outlet_of[sb.name] = design_point
+        dp.subbasins.append(sb.name)
+        dp._local_tc = None
+        self._invalidate(design_point)
+
+    # Edits -------------------------------------------------------------------------------------
+
+    def update_subbasin(self, name: str, **changes):
+        # Change one sub-basin's inputs (tc, areas, Li, ...) in place and invalidate only the
+        # design points downstream of it. SubBasin drops its own stale values
+        if "P1_dict" in changes:
+            # Routing uses one storm for the whole network; a per-basin P1 would be ignored
+            raise ValueError("P1_dict applies to the whole network; use set_P1 to change it")
+        sb = self.subbasins[name]
+        for key, value in changes.items():
+            setattr(sb, key, value)
+        self.replace_subbasin(sb)
+        return sb
+
+    def replace_subbasin(self, sb: SubBasin):
+        dp_name = self._outlet_of[sb.name]
+        self.subbasins[sb.name] = sb
+        self.design_points[dp_name]._local_tc = None
+        self._invalidate(dp_name)
+
+    def set_P1(self, P1_dict: dict[str, float]):
+        # The design storm applies to the whole network, so every basin takes it (keeping
+        # their own discharges consistent with the routing) and every point needs rerouting
+        self.P1_dict = P1_dict
+        for sb in self.subbasins.values():
+            sb.P1_dict = P1_dict
+        for dp in self.design_points.values():
+            dp._local_tc = None
+            dp.dirty = True
+
+    def _invalidate(self, name: str):
+        # Mark a design point and the path below it. Upstream points may stay dirty while a
+        # downstream one is refreshed, so the whole path is always walked
+        node = name
+        while node is not None:
+            dp = self.design_points[node]
+            dp.dirty = True
+            node = dp.downstream
+
+    # Results -----------------------------------------------------------------------------------
+
+    def upstream_points(self, name: str) -> list[str]:
+        # The design point and every point draining to it (connect() keeps the tree acyclic)
+        names = []
+        stack = [name]
+        while stack:
+            node = stack.pop()
+            names.append(node)
+            stack.extend(self.design_points[node].upstream)
+        return names
+
+    def tributaries(self, name: str) -> list[str]:
+        # Names of every sub-basin upstream of a design point
+        return [sb for node in self.upstream_points(name) for sb in self.design_points[node].subbasins]
+
+    def results(self, name: str):
+        # (q_dict, tc_dict) at a design point, recomputing only if something upstream changed
+        dp = self.design_points[name]
+        if dp.dirty:
+            self._recompute(name)
+        return dp.q_dict, dp.tc_dict
+
+    def results_all(self):
+        return {name: self.results(name) for name in self.design_points}
+
+    def dirty_points(self) -> list[str]:
+        return [name for name, dp in self.design_points.items() if dp.dirty]
+
+    def _local_arrays(self, dp: DesignPoint):
+        if dp._local_tc is None:
+            sbs = [self.subbasins[n] for n in dp.subbasins]
+            dp._local_names = list(dp.subbasins)
+            dp._local_tc = np.array([sb.tc for sb in sbs], dtype=float)
+            dp._local_ca = np.array(
+                [[sb.basin_area_ac * sb.c_dict[key] for key in self.P1_dict] for sb in sbs],
+                dtype=float,
+            ).reshape(len(sbs), len(self.P1_dict))
+        return dp._local_tc, dp._local_ca, dp._local_names
+
+    def _recompute(self, name: str):
+        # Gather the cached per-point arrays of the whole upstream tree, then route once.
+        # Upstream results are not needed for routing; dirty upstream points are refreshed
+        # on their own when requested
+        tc_parts, ca_parts, names = [], [], []
+        for node in self.upstream_points(name):
+            tc, ca, local_names = self._local_arrays(self.design_points[node])
+            tc_parts.append(tc)
+            ca_parts.append(ca)
+            names.extend(local_names)
+
+        dp = self.design_points[name]
+        if not names:
+            dp.q_dict = {key: 0.0 for key in self.P1_dict}
+            dp.tc_dict = {key: np.nan for key in self.P1_dict}
+            dp.controlling_basin = {key: None for key in self.P1_dict}
+        else:
+            p1 = np.array(list(self.P1_dict.values()), dtype=float)
+            peak_q, peak_tc, idx = route_arrays(np.concatenate(tc_parts), np.concatenate(ca_parts), p1)
+            dp.q_dict = dict(zip(self.P1_dict, peak_q.tolist()))
+            dp.tc_dict = dict(zip(self.P1_dict, peak_tc.tolist()))
+            dp.controlling_basin = dict(zip(self.P1_dict, [names[i] for i in idx]))
+        dp.dirty = False
@@ -0,0 +1,140 @@
+'''
+Headless batch rendering of pipe water-level figures for report appendices.
+
+plot_pipe_water_level in conduits builds a new pyplot figure per pipe and shows it. Here one
+Agg figure is built once and its artists (water fill, water surface, title, label) are updated
+in place for every pipe, then written as pages of one PDF or as one PNG per pipe. PNG
+directories can be split across worker processes, each with its own figure.
+
+    render_pipes("appendix.pdf", depth, diameter, Q, Q_max, names=pipe_ids)
+    render_pipes("figures/", depth, diameter, Q, Q_max, names=pipe_ids, workers=4)
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.patches import Circle, Polygon
+
+from conduits import water_level_label
+
+# Unit circle, like plot_pipe_water_level (figures are drawn after the hydraulics)
+R = 1.0
+_FILL_POINTS = 200
+
+
+def _water_polygon(depth_ratio):
+    # Circular segment below the water line, as (x, y) points around the wetted perimeter
+    half_angle = np.arccos(1.0 - 2.0 * depth_ratio)
+    t = -np.pi / 2 + np.linspace(-half_angle, half_angle, _FILL_POINTS)
+    return np.column_stack((R * np.cos(t), R * np.sin(t)))
+
+
+class PipeFigure:
+    # One reusable Agg figure; draw() only moves the water artists and changes the text
+
+    def __init__(self, figsize=(6, 6), dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot()
+        ax.set_aspect("equal")
+        ax.set_xlim(-1.2 * R, 1.2 * R)
+        ax.set_ylim(-1.2 * R, 1.2 * R)
+        ax.axis("off")
+
+        self._water = Polygon(_water_polygon(0.0), closed=True, color="cornflowerblue")
+        ax.add_patch(self._water)
+        ax.add_patch(Circle((0, 0), R, fill=False, linewidth=3))
+        self._surface = Line2D([], [], color="blue", linewidth=2)
+        ax.add_line(self._surface)
+        self._title = ax.set_title("")
+        self._label = self.figure.text(0.5, 0.04, "", ha="center", va="bottom")
+
+    def draw(self, depth, diameter, Q, Q_max, name=None):
+        percent_D = max(0.0, min(1.0, depth / diameter)) if np.isfinite(depth) else 1.0
+        depth_y = -R + 2 * R * percent_D
+        half_width = np.sqrt(max(0.0, R**2 - depth_y**2))
+
+        self._water.set_xy(_water_polygon(percent_D))
+        self._surface.set_data([-half_width, half_width], [depth_y, depth_y])
+        title = f"Water Level: {100 * percent_D:.1f}% of Diameter"
+        self._title.set_text(title if name is None else f"{name}\n{title}")
+        self._label.set_text(water_level_label(depth, Q, Q_max))
+        return self.figure
+
+
+def _png_path(directory, name):
+    return os.path.join(directory, f"{name}.png")
+
+
+def _render_png_chunk(directory, rows, figsize, dpi):
+    # Worker: one figure for the whole chunk
+    fig = PipeFigure(figsize=figsize, dpi=dpi)
+    paths = []
+    for name, depth, diameter, Q, Q_max in rows:
+        # Fast zlib level: default PNG compression dominates the time per figure
+        fig.draw(depth, diameter, Q, Q_max, name=name).savefig(
+            _png_path(directory, name), pil_kwargs={"compress_level": 1}
+        )
+        paths.append(_png_path(directory, name))
+    return paths
+
+
+def render_pipes(
+    out: str,
+    depth,
+    diameter,
+    Q,
+    Q_max,
+    names=None,
+    workers: int = 1,
+    figsize=(6, 6),
+    dpi: int = 100,
+):
+    """
+    Render one water-level figure per pipe.
+
+    Parameters
+    ----------
+    out : str
+        A path ending in .pdf for a multi-page PDF (one page per pipe); anything else is a
+        directory (created if needed) that gets one <name>.png per pipe.
+    depth, diameter, Q, Q_max : array-like
+        Normal depth (ft), diameter (ft), design flow and full-pipe capacity (cfs) per pipe.
+    names : list, optional
+        Pipe labels used in titles and PNG file names (default: pipe_0, pipe_1, ...).
+    workers : int
+        Processes for PNG output. PDF pages are written in order by a single process.
+
+    Returns
+    -------
+    list of str
+        The PDF path, or the PNG paths in pipe order.
+    """
+    depth, diameter, Q, Q_max = (np.atleast_1d(np.asarray(v, dtype=float)) for v in (depth, diameter, Q, Q_max))
+    depth, diameter, Q, Q_max = np.broadcast_arrays(depth, diameter, Q, Q_max)
+    if names is None:
+        names = [f"pipe_{i}" for i in range(len(depth))]
+    rows = list(zip((str(n) for n in names), depth.tolist(), diameter.tolist(), Q.tolist(), Q_max.tolist()))
+
+    if out.lower().endswith(".pdf"):
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        fig = PipeFigure(figsize=figsize, dpi=dpi)
+        with PdfPages(out) as pdf:
+            for name, d, D, q, q_max in rows:
+                pdf.savefig(fig.draw(d, D, q, q_max, name=name))
+        return [out]
+
+    os.makedirs(out, exist_ok=True)
+    if workers <= 1 or len(rows) < 2 * workers:
+        return _render_png_chunk(out, rows, figsize, dpi)
+
+    size = -(-len(rows) // workers)
+    chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_render_png_chunk, [out] * len(chunks), chunks, [figsize] * len(chunks), [dpi] * len(chunks))
+        return [path for paths in results for path in paths]
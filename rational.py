@@ -10,11 +10,47 @@ where the sub-basin names are primary keys and all the data that's currently get
 # across multiple columns in the spreadsheet can be contained more neatly?
 '''
 
+import time
+from functools import cached_property, lru_cache
+
 import numpy as np
-import pandas as pd
+
+from records import RecordArray, RecordView
+
+# Optional diagnostics hook, called as hook(calc_name, {"seconds", "n"}) once per SubBasin
+# discharge evaluation, BasinTable build and route_arrays call (n = basins involved).
+# Left as None nothing is timed; see instrumentation.SolverStats
+_calc_hook = None
+
+
+def set_calc_hook(hook):
+    # Install (or clear, with None) the diagnostics hook; returns the previous one
+    global _calc_hook
+    previous = _calc_hook
+    _calc_hook = hook
+    return previous
+
 
 # Classes
+def _c_column_property(j):
+    # Read-only attribute for one return period of an Area's c_values row
+    return property(lambda self: float(self.c_values[j]))
+
+
+def _area_c_property(j):
+    # One return period of a single Area, evaluated from its soil group and imperviousness
+    def c_value(self):
+        k, p, m = _C_ROWS[_soil_group_code(self.nrcs_soil_group)][j]
+        return k * float(self.impervious_ratio)**p + m
+    return property(c_value)
+
+
 class Area:
+    # __slots__ keeps big lists of Areas small (no per-object __dict__), and only the three
+    # inputs are stored: C-values are evaluated from them when read. For millions of records
+    # use AreaArray, which holds the same fields in contiguous arrays
+    __slots__ = ("area_ac", "nrcs_soil_group", "impervious_ratio")
+
     def __init__(
         self,
         area_ac: float,
@@ -24,13 +60,101 @@ class Area:
         self.area_ac = area_ac
         self.nrcs_soil_group = nrcs_soil_group
         self.impervious_ratio = impervious_ratio
-        self.cWQE = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["cWQE"]
-        self.c005 = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["c005"]
-        self.c010 = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["c010"]
-        self.c025 = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["c025"]
-        self.c050 = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["c050"]
-        self.c100 = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["c100"]
-        self.c500 = get_c_inflitration(nrcs_soil_type=nrcs_soil_group, impervious_pct=impervious_ratio)["c500"]
+        # Fail on a bad soil group here rather than on the first C-value read
+        _soil_group_code(nrcs_soil_group)
+
+    @property
+    def c_values(self):
+        # All return periods in RETURN_PERIODS order, as Python floats. Scalar path: one Area
+        # doesn't need get_c_array's label lookup and array setup
+        return _c_scalar(_soil_group_code(self.nrcs_soil_group), self.impervious_ratio)
+
+    cWQE = _area_c_property(0)
+    c002 = _area_c_property(1)
+    c005 = _area_c_property(2)
+    c010 = _area_c_property(3)
+    c025 = _area_c_property(4)
+    c050 = _area_c_property(5)
+    c100 = _area_c_property(6)
+    c500 = _area_c_property(7)
+
+    @classmethod
+    def from_arrays(cls, area_ac, nrcs_soil_groups, impervious_ratios):
+        # Build many Areas (e.g. a GIS parcel layer); soil groups are checked in one pass
+        area_ac = np.asarray(area_ac, dtype=float).tolist()
+        impervious_ratios = np.asarray(impervious_ratios, dtype=float).tolist()
+        codes = soil_group_codes(nrcs_soil_groups).tolist()
+
+        areas = []
+        for i in range(len(area_ac)):
+            area = cls.__new__(cls)
+            area.area_ac = area_ac[i]
+            area.nrcs_soil_group = SOIL_GROUPS[codes[i]]
+            area.impervious_ratio = impervious_ratios[i]
+            areas.append(area)
+        return areas
+
+
+class AreaArray(RecordArray):
+    # Struct-of-arrays store for parcel-scale area layers: about 21 bytes per record instead of a
+    # Python object each. basin_idx is the row of the owning basin (e.g. in a BasinTable).
+    # Runoff coefficients are computed for the whole array on first use and cached.
+    _fields = {
+        "basin_idx": np.int32,
+        "area_ac": np.float64,
+        "soil_code": np.int8,
+        "impervious_ratio": np.float64,
+    }
+
+    class View(RecordView):
+        __slots__ = ()
+
+        @property
+        def nrcs_soil_group(self):
+            return SOIL_GROUPS[self._owner._data["soil_code"][self._index]]
+
+        @property
+        def c_values(self):
+            return self._owner.c_values[self._index]
+
+        cWQE = _c_column_property(0)
+        c002 = _c_column_property(1)
+        c005 = _c_column_property(2)
+        c010 = _c_column_property(3)
+        c025 = _c_column_property(4)
+        c050 = _c_column_property(5)
+        c100 = _c_column_property(6)
+        c500 = _c_column_property(7)
+
+    @classmethod
+    def from_columns(cls, basin_idx, area_ac, nrcs_soil_groups, impervious_ratios):
+        # Same as the constructor, but soil groups may be labels ("A", "B", "C/D")
+        return cls(
+            basin_idx=basin_idx,
+            area_ac=area_ac,
+            soil_code=soil_group_codes(nrcs_soil_groups),
+            impervious_ratio=impervious_ratios,
+        )
+
+    @property
+    def c_values(self):
+        # (N, 8) coefficients in RETURN_PERIODS order
+        if getattr(self, "_c_cache", None) is None:
+            self._c_cache = get_c_array(self.column("soil_code"), self.column("impervious_ratio"))
+        return self._c_cache
+
+    def _changed(self, *names):
+        if "soil_code" in names or "impervious_ratio" in names:
+            self._c_cache = None
+
+    def to_areas(self) -> list[Area]:
+        return Area.from_arrays(self.column("area_ac"), self.column("soil_code"), self.column("impervious_ratio"))
+
+
+def _c_property(key):
+    # Read-only attribute view of one entry of SubBasin.c_dict
+    return property(lambda self: self.c_dict[key])
+
 
 class SubBasin:
     # Sub-Basin class: main spatial unit for rational analysis using MHFD sheets
@@ -42,6 +166,21 @@ class SubBasin:
     # {P1} applies to all sub-basins, while tc is specific to each sub-basin and can be tweaked by users
     # Tweaking tc will require recalculating Intensity and Q arrays
 
+    # Derived values are computed on first access and cached. Reassigning an input drops exactly
+    # the cached values that depend on it. In-place edits (areas.append, P1_dict[...] = ...)
+    # can't be seen, so follow those with sb.invalidate("areas") / sb.invalidate("P1_dict").
+    _DEPENDENTS = {
+        "areas": ("_area_arrays", "area_count", "basin_area_ac", "soil_groups", "basin_pct_imp",
+                  "c_dict", "ti", "tc_normal", "tc_region", "_tc_auto", "discharge_dict"),
+        "Li": ("ti", "tc_normal", "_tc_auto"),
+        "Si": ("ti", "tc_normal", "_tc_auto"),
+        "Lt": ("tt", "tc_normal", "tc_region", "_tc_auto"),
+        "St": ("tt", "tc_normal", "tc_region", "_tc_auto"),
+        "K": ("tt", "tc_normal", "_tc_auto"),
+        "tc": ("intensity_dict", "discharge_dict"),
+        "P1_dict": ("intensity_dict", "discharge_dict"),
+    }
+
     def __init__(
         self,
         name: str,
@@ -55,86 +194,486 @@ class SubBasin:
         tc=None,
     ):
 
-        self.name = name
-        self.Li = Li
-        self.Si = Si
-        self.Lt = Lt
-        self.St = St
-        self.K = K
-        self.areas = areas
-        self.P1_dict = P1_dict
-        self.tc = tc
-
-        # Area count
-        self.area_count = len(areas)
-
-        # Total basin area: sum of all constituent are objects
-        self.basin_area_ac = sum(a.area_ac for a in areas)
-
-        # List of all soil groups, duplicates removed
-        self.soil_groups = sorted(list(set([a.nrcs_soil_group for a in areas])))
-
-        # Basin imperviousness: area-weighted average of Area objects' imperviousness
-        self.basin_pct_imp = sum(area.impervious_ratio * area.area_ac for area in areas) / self.basin_area_ac
-
-        basin_df = pd.DataFrame()
-
-        # Runoff coefficients (weighted by area)
-        self.cWQE = sum(area.area_ac * area.cWQE for area in areas) / self.basin_area_ac
-        self.c002 = sum(area.area_ac * area.cWQE for area in areas) / self.basin_area_ac
-        self.c005 = sum(area.area_ac * area.c005 for area in areas) / self.basin_area_ac
-        self.c010 = sum(area.area_ac * area.c010 for area in areas) / self.basin_area_ac
-        self.c025 = sum(area.area_ac * area.c025 for area in areas) / self.basin_area_ac
-        self.c050 = sum(area.area_ac * area.c050 for area in areas) / self.basin_area_ac
-        self.c100 = sum(area.area_ac * area.c100 for area in areas) / self.basin_area_ac
-        self.c500 = sum(area.area_ac * area.c500 for area in areas) / self.basin_area_ac
-        # self.c_list = [self.cWQE, self.c005, self.c010, self.c025, self.c050, self.c100, self.c500]
-        self.c_dict= {
-            "cWQE": self.cWQE,
-            "c002": self.c002,
-            "c005": self.c005,
-            "c010": self.c010,
-            "c025": self.c025,
-            "c050": self.c050,
-            "c100": self.c100,
-            "c500": self.c500,
-        }
-
-        # Calculated values based on MHFD criteria
-        self.ti = 0.395 * (1.1 - self.c005) * np.sqrt(Li) / np.pow(Si, 0.33)
-        self.tt = Lt / (60 * K * np.sqrt(St))
+        # Nothing is cached yet, so the inputs go straight into __dict__ without invalidation
+        self.__dict__.update(
+            name=name, Li=Li, Si=Si, Lt=Lt, St=St, K=K, areas=areas, P1_dict=P1_dict, _tc_override=tc
+        )
+
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+        if key in SubBasin._DROP:
+            self.invalidate(key)
+
+    def invalidate(self, *inputs):
+        # Drop the cached values that depend on the named inputs (everything if none are named).
+        # A new automatic tc only matters when the user hasn't set one
+        cache = self.__dict__
+        auto = cache.get("_tc_override") is None
+        for key in inputs or SubBasin._DROP:
+            for dep in SubBasin._DROP[key][auto]:
+                cache.pop(dep, None)
+
+    # tc: a user value if one was set, otherwise the automatic choice. Set to None to go back
+    @property
+    def tc(self):
+        if self._tc_override is None:
+            return self._tc_auto
+        return self._tc_override
+
+    @tc.setter
+    def tc(self, value):
+        # Cache invalidation for "tc" happens in __setattr__
+        self.__dict__["_tc_override"] = value
+
+    # One basin is a single group, so the area weighting below is a plain sum / dot product
+    # rather than the per-column bincounts BasinTable uses for many basins
+    @cached_property
+    def _area_arrays(self):
+        area_arr = np.array([a.area_ac for a in self.areas], dtype=float)
+        imp_arr = np.array([a.impervious_ratio for a in self.areas], dtype=float)
+        # Same vectorized C equations as BasinTable; integer codes skip get_c_array's label lookup
+        codes = np.array([_soil_group_code(a.nrcs_soil_group) for a in self.areas], dtype=np.intp)
+        return area_arr, imp_arr, get_c_array(codes, imp_arr)
+
+    # Area count
+    @cached_property
+    def area_count(self):
+        return len(self.areas)
+
+    # Total basin area: sum of all constituent are objects
+    @cached_property
+    def basin_area_ac(self):
+        return self._area_arrays[0].sum()
+
+    # List of all soil groups, duplicates removed
+    @cached_property
+    def soil_groups(self):
+        return sorted(list(set([a.nrcs_soil_group for a in self.areas])))
+
+    # Basin imperviousness: area-weighted average of Area objects' imperviousness
+    @cached_property
+    def basin_pct_imp(self):
+        area_arr, imp_arr, _ = self._area_arrays
+        return area_arr @ imp_arr / self.basin_area_ac
+
+    # Runoff coefficients (weighted by area), all return periods at once
+    @cached_property
+    def c_dict(self):
+        area_arr, _, c_matrix = self._area_arrays
+        return dict(zip(RETURN_PERIODS, (area_arr @ c_matrix / self.basin_area_ac).tolist()))
+
+    cWQE = _c_property("cWQE")
+    c002 = _c_property("c002")
+    c005 = _c_property("c005")
+    c010 = _c_property("c010")
+    c025 = _c_property("c025")
+    c050 = _c_property("c050")
+    c100 = _c_property("c100")
+    c500 = _c_property("c500")
+
+    # Calculated values based on MHFD criteria
+    @cached_property
+    def ti(self):
+        return mhfd_ti(self.c005, self.Li, self.Si)
+
+    @cached_property
+    def tt(self):
+        return mhfd_tt(self.Lt, self.St, self.K)
+
+    @cached_property
+    def tc_normal(self):
+        return self.ti + self.tt
+
+    @cached_property
+    def tc_region(self):
+        return mhfd_tc_regional(self.basin_pct_imp, self.Lt, self.St)
+
+    # TODO: allow a user to pick regional or normal tc; possibly by having a textbox pass a
+    # number to this block, like -1 for normal and -2 for regional?
+    # DURING DEV: using min of (normal, regional) so we can write the rest
+    @cached_property
+    def _tc_auto(self):
+        return min(self.tc_region, self.tc_normal)
+
+    @cached_property
+    def intensity_dict(self):
+        return self.get_intensity()
+
+    @cached_property
+    def discharge_dict(self):
+        return self.get_discharges()
+
+    def get_intensity(self, a=28.5, b=10.0, c=0.786):
+        # Recomputes (and re-caches) intensity, e.g. for non-default IDF coefficients
+        intensity = get_intensity(list(self.P1_dict.values()), [self.tc], a=a, b=b, c=c)[0]
+        intensity_dict = dict(zip(self.P1_dict, intensity.tolist()))
+        self.__dict__["intensity_dict"] = intensity_dict
+        self.__dict__.pop("discharge_dict", None)
+        return intensity_dict
+
+    # NOTE: need to handle the differnce dict sizes:
+    # For C-values, 2-year and WQE are the same. Maybe add a redundancy c value to get 1:1?
+    def get_discharges(self):
+        start = time.perf_counter() if _calc_hook is not None else 0.0
+        discharge_dict = {}
+        for key, value in self.P1_dict.items():
+            discharge_dict[key] = self.basin_area_ac * \
+                                  self.intensity_dict[key] * self.c_dict[key]
+        self.__dict__["discharge_dict"] = discharge_dict
+        if _calc_hook is not None:
+            _calc_hook("SubBasin", {"seconds": time.perf_counter() - start, "n": 1})
+        return discharge_dict
 
+    debug = True
+
+
+# Flattened per input: (values to drop with a user tc, values to drop with the automatic tc)
+SubBasin._DROP = {
+    key: (deps, deps + SubBasin._DEPENDENTS["tc"] if "_tc_auto" in deps else deps)
+    for key, deps in SubBasin._DEPENDENTS.items()
+}
+
+
+class BasinTable:
+    # Columnar counterpart of SubBasin for studies with thousands of sub-basins.
+    # One row per basin; per-return-period values are (n_basins, n_return_periods) arrays with
+    # columns in the order of P1_dict (same keys as SubBasin.intensity_dict / discharge_dict).
+    # Every formula goes through the same helpers SubBasin uses, so a row matches the
+    # per-object result (to rounding: area sums here add per basin with bincount).
+
+    def __init__(
+        self,
+        names,
+        Li,
+        Si,
+        Lt,
+        St,
+        K,
+        area_basin_idx,
+        area_ac,
+        nrcs_soil_groups,
+        impervious_ratios,
+        P1_dict: dict[str, float],
+        tc=None,
+    ):
+        """
+        Parameters
+        ----------
+        names, Li, Si, Lt, St, K : array-like
+            One entry per basin, same meaning as the SubBasin arguments.
+        area_basin_idx : array-like of int
+            Row of the basin each area record belongs to.
+        area_ac, nrcs_soil_groups, impervious_ratios : array-like
+            One entry per area record, same meaning as the Area arguments.
+        P1_dict : dict
+            {rtn_prd: P1} pairs shared by every basin.
+        tc : array-like, optional
+            User tc per basin; NaN (or tc=None for all) falls back to min(regional, normal).
+        """
+        start = time.perf_counter() if _calc_hook is not None else 0.0
+        self.names = np.asarray(names)
+        n = len(self.names)
+        self.Li = np.asarray(Li, dtype=float)
+        self.Si = np.asarray(Si, dtype=float)
+        self.Lt = np.asarray(Lt, dtype=float)
+        self.St = np.asarray(St, dtype=float)
+        self.K = np.asarray(K, dtype=float)
+        self.P1_dict = P1_dict
+        self.return_periods = tuple(P1_dict)
+
+        area_basin_idx = np.asarray(area_basin_idx, dtype=np.intp)
+        area_ac = np.asarray(area_ac, dtype=float)
+        impervious_ratios = np.asarray(impervious_ratios, dtype=float)
+
+        self.area_count = np.bincount(area_basin_idx, minlength=n)
+        self.basin_area_ac = _group_sum(area_basin_idx, area_ac, n)
+        self.basin_pct_imp = _group_weighted(area_basin_idx, area_ac, impervious_ratios, n)
+        # (n_basins, 8) in RETURN_PERIODS order, like SubBasin.c_dict
+        self.c = _group_weighted(
+            area_basin_idx, area_ac, get_c_array(nrcs_soil_groups, impervious_ratios), n
+        )
+
+        self.ti = mhfd_ti(self.c[:, RETURN_PERIODS.index("c005")], self.Li, self.Si)
+        self.tt = mhfd_tt(self.Lt, self.St, self.K)
         self.tc_normal = self.ti + self.tt
-        self.tc_region = (26 - 17*self.basin_pct_imp) + \
-                         (self.Lt / (60 * (14 * self.basin_pct_imp + 9) * np.sqrt(St)))
+        self.tc_region = mhfd_tc_regional(self.basin_pct_imp, self.Lt, self.St)
 
-        # TODO: allow a user to pick regional or normal tc; possibly by having a textbox pass a
-        # number to this block, like -1 for normal and -2 for regional?
-        # DURING DEV: using min of (normal, regional) so we can write the rest
-        if self.tc is None:
-            self.tc = min(self.tc_region, self.tc_normal)
+        self.tc = np.minimum(self.tc_region, self.tc_normal)
+        if tc is not None:
+            tc = np.broadcast_to(np.asarray(tc, dtype=float), (n,))
+            self.tc = np.where(np.isnan(tc), self.tc, tc)
 
-        self.intensity_dict = {}
-        self.discharge_dict = {}
         self.get_intensity()
         self.get_discharges()
+        if _calc_hook is not None:
+            _calc_hook("BasinTable", {"seconds": time.perf_counter() - start, "n": n})
+
+    @classmethod
+    def from_area_array(cls, names, Li, Si, Lt, St, K, areas: AreaArray, P1_dict: dict[str, float], tc=None):
+        # Basin columns plus an AreaArray whose basin_idx points into them
+        return cls(
+            names, Li, Si, Lt, St, K,
+            area_basin_idx=areas.column("basin_idx"),
+            area_ac=areas.column("area_ac"),
+            nrcs_soil_groups=areas.column("soil_code"),
+            impervious_ratios=areas.column("impervious_ratio"),
+            P1_dict=P1_dict,
+            tc=tc,
+        )
+
+    @classmethod
+    def from_subbasins(cls, subbasins: list[SubBasin], P1_dict: dict[str, float] = None):
+        # Flatten existing SubBasin objects into columns (P1 defaults to the first basin's)
+        area_basin_idx = [i for i, sb in enumerate(subbasins) for _ in sb.areas]
+        areas = [a for sb in subbasins for a in sb.areas]
+        return cls(
+            names=[sb.name for sb in subbasins],
+            Li=[sb.Li for sb in subbasins],
+            Si=[sb.Si for sb in subbasins],
+            Lt=[sb.Lt for sb in subbasins],
+            St=[sb.St for sb in subbasins],
+            K=[sb.K for sb in subbasins],
+            area_basin_idx=area_basin_idx,
+            area_ac=[a.area_ac for a in areas],
+            nrcs_soil_groups=[a.nrcs_soil_group for a in areas],
+            impervious_ratios=[a.impervious_ratio for a in areas],
+            P1_dict=subbasins[0].P1_dict if P1_dict is None else P1_dict,
+            # Only user-set tc values; NaN rows get the vectorized automatic tc above instead of
+            # forcing each SubBasin's own lazy calculation
+            tc=[
+                np.nan if sb.__dict__["_tc_override"] is None else sb.__dict__["_tc_override"]
+                for sb in subbasins
+            ],
+        )
+
+    def __len__(self):
+        return len(self.names)
 
     def get_intensity(self, a=28.5, b=10.0, c=0.786):
-        for key, value in self.P1_dict.items():
-            self.intensity_dict[key] = (a * value) / (b + self.tc)**c
-        # return (a * P1) / (b + self.tc)**c
+        self.intensity = get_intensity(list(self.P1_dict.values()), self.tc, a=a, b=b, c=c)
+        return self.intensity
 
-    # NOTE: need to handle the differnce dict sizes:
-    # For C-values, 2-year and WQE are the same. Maybe add a redundancy c value to get 1:1?
     def get_discharges(self):
-        for key, value in self.P1_dict.items():
-            self.discharge_dict[key] = self.basin_area_ac * \
-                                       self.intensity_dict[key] * self.c_dict[key]
+        c_cols = self.c[:, [RETURN_PERIODS.index(key) for key in self.return_periods]]
+        self.discharge = self.basin_area_ac[:, None] * self.intensity * c_cols
+        return self.discharge
+
+    def to_dataframe(self):
+        # Spreadsheet-style summary: one row per basin, I and Q columns per return period.
+        # pandas is only needed here, so it is imported on first use
+        import pandas as pd
+
+        df = pd.DataFrame({
+            "name": self.names,
+            "area_ac": self.basin_area_ac,
+            "pct_imp": self.basin_pct_imp,
+            "ti": self.ti,
+            "tt": self.tt,
+            "tc_normal": self.tc_normal,
+            "tc_region": self.tc_region,
+            "tc": self.tc,
+        })
+        for j, key in enumerate(RETURN_PERIODS):
+            df[key] = self.c[:, j]
+        for j, key in enumerate(self.return_periods):
+            df[f"I_{key}"] = self.intensity[:, j]
+            df[f"Q_{key}"] = self.discharge[:, j]
+        return df.set_index("name")
 
     debug = True
 
 # Functions ------------------------------------------------------------------------------------------------
 
+class IDF:
+    # Intensity-duration-frequency surface for one design storm: I = (a * P1) / (b + tc)^c.
+    # On the first lookup() intensity is tabulated on a uniform tc grid for every return
+    # period, so sensitivity runs can look up thousands of tc values by interpolation.
+    # SubBasin / BasinTable / route_arrays use the exact get_intensity() instead.
+    # Build through idf_for_storm() to share one instance between all users of the same
+    # regional P1 set.
+
+    def __init__(
+        self,
+        P1_dict: dict[str, float],
+        a=28.5,
+        b=10.0,
+        c=0.786,
+        tc_max=360.0,
+        tc_step=0.1,
+    ):
+        self.P1_dict = dict(P1_dict)
+        self.return_periods = tuple(P1_dict)
+        self.a, self.b, self.c = a, b, c
+        self._P1 = np.array(list(P1_dict.values()), dtype=float)
+
+        self.tc_step = tc_step
+        self.tc_grid = np.arange(int(round(tc_max / tc_step)) + 1) * tc_step
+
+    @cached_property
+    def surface(self):
+        # (n_grid, n_return_periods) in/hr, built on first use
+        return get_intensity(self._P1, self.tc_grid, a=self.a, b=self.b, c=self.c)
+
+    def lookup(self, tc):
+        # Interpolated (len(tc), n_return_periods) intensity from the tabulated surface.
+        # Linear interpolation of this smooth curve is within 1.8e-5 relative at the default
+        # 0.1 min step (largest at short tc); tc beyond the grid is evaluated exactly
+        tc = np.asarray(tc, dtype=float).ravel()
+        pos = tc / self.tc_step
+        i = np.clip(pos.astype(np.intp), 0, len(self.tc_grid) - 2)
+        frac = (pos - i)[:, None]
+        out = self.surface[i] * (1.0 - frac) + self.surface[i + 1] * frac
+        outside = (tc < 0) | (tc > self.tc_grid[-1])
+        if outside.any():
+            out[outside] = get_intensity(self._P1, tc[outside], a=self.a, b=self.b, c=self.c)
+        return out
+
+    def intensity_dict(self, tc: float) -> dict[str, float]:
+        # Exact intensity at one tc
+        intensity = get_intensity(self._P1, [tc], a=self.a, b=self.b, c=self.c)[0]
+        return dict(zip(self.return_periods, intensity.tolist()))
+
+
+# Return periods in the order used by all of the array APIs. WQE and 2-year share a C-value
+RETURN_PERIODS = ("cWQE", "c002", "c005", "c010", "c025", "c050", "c100", "c500")
+SOIL_GROUPS = ("A", "B", "C/D")
+
+# Same equations as get_c_inflitration, written as C = k * imp**p + m so every soil group
+# and return period can be evaluated at once. Rows follow SOIL_GROUPS, columns RETURN_PERIODS
+_C_K = np.array([
+    [0.840, 0.840, 0.861, 0.873, 0.884, 0.854, 0.779, 0.654],
+    [0.835, 0.835, 0.857, 0.807, 0.628, 0.558, 0.465, 0.366],
+    [0.834, 0.834, 0.815, 0.735, 0.560, 0.494, 0.409, 0.315],
+])
+_C_P = np.array([
+    [1.302, 1.302, 1.276, 1.232, 1.124, 1.000, 1.000, 1.000],
+    [1.169, 1.169, 1.088, 1.000, 1.000, 1.000, 1.000, 1.000],
+    [1.122, 1.122, 1.000, 1.000, 1.000, 1.000, 1.000, 1.000],
+])
+_C_M = np.array([
+    [0.000, 0.000, 0.000, 0.000, 0.000, 0.025, 0.110, 0.254],
+    [0.000, 0.000, 0.000, 0.025, 0.249, 0.328, 0.426, 0.536],
+    [0.000, 0.000, 0.035, 0.132, 0.319, 0.393, 0.484, 0.588],
+])
+
+
+# The same coefficients as Python floats, one (k, p, m) tuple per return period for each
+# soil group, for single-area calculations
+_C_ROWS = tuple(tuple(zip(k, p, m)) for k, p, m in zip(_C_K.tolist(), _C_P.tolist(), _C_M.tolist()))
+
+
+def _soil_group_code(nrcs_soil_group) -> int:
+    # Scalar counterpart of soil_group_codes
+    try:
+        return SOIL_GROUPS.index(nrcs_soil_group.upper())
+    except (ValueError, AttributeError):
+        raise ValueError('nrcs_soil_type must be in ["A", "B", or "C/D"') from None
+
+
+def _c_scalar(code: int, impervious_pct: float) -> tuple:
+    # C-values of one area in RETURN_PERIODS order, same equations as get_c_array
+    imp = float(impervious_pct)
+    return tuple(k * imp**p + m for k, p, m in _C_ROWS[code])
+
+
+def soil_group_codes(nrcs_soil_groups):
+    # Map soil group labels ("A", "b", "C/D", ...) to row indices of SOIL_GROUPS.
+    # Integer arrays are assumed to already be codes and are only range-checked
+    groups = np.asarray(nrcs_soil_groups)
+    if groups.dtype.kind in "iu":
+        codes = groups.astype(np.intp)
+        if codes.size and (codes.min() < 0 or codes.max() >= len(SOIL_GROUPS)):
+            raise ValueError('nrcs_soil_type must be in ["A", "B", or "C/D"')
+        return codes
+
+    # Only the distinct labels go through Python; everything else is an index lookup
+    labels, inverse = np.unique(groups.astype(str), return_inverse=True)
+    lookup = np.empty(len(labels), dtype=np.intp)
+    for i, label in enumerate(labels):
+        try:
+            lookup[i] = SOIL_GROUPS.index(label.upper())
+        except ValueError:
+            raise ValueError('nrcs_soil_type must be in ["A", "B", or "C/D"') from None
+    return lookup[inverse.reshape(groups.shape)]
+
+
+def get_c_array(
+    nrcs_soil_groups,
+    impervious_pcts,
+):
+    """
+    Runoff coefficients for many areas in one vectorized pass.
+
+    Parameters
+    ----------
+    nrcs_soil_groups : array-like of str or int
+        Soil group labels ("A", "B", "C/D") or their SOIL_GROUPS indices.
+    impervious_pcts : array-like of float
+        Impervious fraction (0-1) of each area.
+
+    Returns
+    -------
+    np.ndarray
+        (N, 8) array of C-values, columns in RETURN_PERIODS order.
+    """
+    codes = soil_group_codes(nrcs_soil_groups).ravel()
+    imp = np.asarray(impervious_pcts, dtype=float).ravel()
+    if codes.shape != imp.shape:
+        raise ValueError("nrcs_soil_groups and impervious_pcts must be the same length")
+    return _C_K[codes] * np.power(imp[:, None], _C_P[codes]) + _C_M[codes]
+
+
+def _group_sum(group_idx, values, n_groups):
+    # Sum values (1D or 2D, one row per record) into n_groups rows
+    if values.ndim == 1:
+        return np.bincount(group_idx, weights=values, minlength=n_groups)
+    return np.stack(
+        [np.bincount(group_idx, weights=values[:, j], minlength=n_groups) for j in range(values.shape[1])],
+        axis=1,
+    )
+
+
+def _group_weighted(group_idx, area_ac, values, n_groups):
+    # Area-weighted average of values within each group
+    total = _group_sum(group_idx, area_ac, n_groups)
+    if values.ndim == 1:
+        return _group_sum(group_idx, area_ac * values, n_groups) / total
+    return _group_sum(group_idx, area_ac[:, None] * values, n_groups) / total[:, None]
+
+
+# MHFD tc components. These work on scalars or arrays so SubBasin and BasinTable share them
+def mhfd_ti(c005, Li, Si):
+    # Initial (overland) flow time, minutes
+    return 0.395 * (1.1 - c005) * np.sqrt(Li) / np.pow(Si, 0.33)
+
+
+def mhfd_tt(Lt, St, K):
+    # Channelized travel time, minutes
+    return Lt / (60 * K * np.sqrt(St))
+
+
+def mhfd_tc_regional(pct_imp, Lt, St):
+    # Regional (urbanized) tc, minutes
+    return (26 - 17*pct_imp) + (Lt / (60 * (14 * pct_imp + 9) * np.sqrt(St)))
+
+
+@lru_cache(maxsize=64)
+def _idf_cached(P1_items: tuple, a, b, c):
+    return IDF(dict(P1_items), a=a, b=b, c=c)
+
+
+def idf_for_storm(P1_dict: dict[str, float], a=28.5, b=10.0, c=0.786) -> IDF:
+    # Shared IDF per (P1 set, coefficients), so repeated lookups reuse one tabulated surface
+    return _idf_cached(tuple(P1_dict.items()), a, b, c)
+
+
+def get_intensity(P1, tc, a=28.5, b=10.0, c=0.786):
+    # MHFD IDF: I = (a * P1) / (b + tc)^c for every (tc, P1) pair -> (len(tc), len(P1)) in/hr
+    P1 = np.asarray(P1, dtype=float)
+    tc = np.asarray(tc, dtype=float)
+    return (a * P1)[None, :] / np.power(b + tc, c)[:, None]
+
+
 def get_c_inflitration(
     nrcs_soil_type: str,
     impervious_pct: float
@@ -184,45 +723,79 @@ def get_c_inflitration(
 
 def route_sbs_at_dp(
     subbasins: list,
-    # return_prd: str
+    P1_dict: dict[str, float] = None,
+    a=28.5,
+    b=10.0,
+    c=0.786,
 ):
     # For a design point, take a list of tributary sub-basins
-    # For each sub-basin, generate a flow by doing the below: (outer loop)
-    # 1. Set that basin's [rainfall intensity] as the intensity for all subbasins
-    # 2. For each subbasin, if its tc < basin tc, define % intensity (default = 1.00) (inner loop)
-    # 3. Within inner loop, multiply C * A * % intensity
-
-    # TODO: have this automatically do all return periods
-    # TODO: design a GUI element (dict backend?) that matches a human-readable return period to sb.c_rtnprd
-
+    # Each sub-basin's tc is tried as the controlling (storm) duration:
+    # 1. That basin's tc sets the rainfall intensity for all tributaries
+    # 2. Basins with tc <= the controlling tc contribute their full C * A
+    # 3. Slower basins only have (controlling tc / own tc) of their area contributing
+    # The design point Q is the largest of those scenarios, for every return period at once.
     # Re-creating the logic from column Q of the 'Runoff Routing' sheet (basin routing to design points)
-    for h in subbasins[0].c_dict.keys():
-        print(f'{h}\t{subbasins[0].c_dict[h]}')
-
-
-    for i, sb_outer in enumerate(subbasins):
-        intensity = sb_outer.intensity
-
-        # array to hold the flows from each routing scenario (where flow and tc are based on each
-        # outer-loop basin zero through i)
-        q_all_ab = np.zeros(len(subbasins))
-
-        # set a dummy variable to hold the sum of all sub-basins (zero through j) routing the flow
-        # from the current (ith) basin in the outer loop
-        trial_q = 0
-        for j, sb_inner in enumerate(subbasins):
-            pct_intensity = max(1, sb_inner/sb_outer)
-            # Q = CIA * %tc for basins with longer tc that the ith basin.
-            q_sb_inner = sb_inner.basin_c005 * sb_inner.basin_area_ac * intensity * pct_intensity
-            trial_q += q_sb_inner
-
-        q_all_ab[i] = trial_q
-
-
-    debug = True
 
+    # TODO: design a GUI element (dict backend?) that matches a human-readable return period to sb.c_rtnprd
+    if P1_dict is None:
+        P1_dict = subbasins[0].P1_dict
 
-    return True
+    tc = np.array([sb.tc for sb in subbasins], dtype=float)
+    ca = np.array(
+        [[sb.basin_area_ac * sb.c_dict[key] for key in P1_dict] for sb in subbasins],
+        dtype=float,
+    )
+    p1 = np.array(list(P1_dict.values()), dtype=float)
+
+    peak_q, peak_tc, _ = route_arrays(tc, ca, p1, a=a, b=b, c=c)
+    q_dict = dict(zip(P1_dict, peak_q.tolist()))
+    tc_dict = dict(zip(P1_dict, peak_tc.tolist()))
+    return q_dict, tc_dict
+
+
+def route_arrays(tc, ca, P1, a=28.5, b=10.0, c=0.786):
+    """
+    Critical-duration routing of tributary basins at one design point.
+
+    Sorting by tc turns the all-scenarios double loop into two cumulative sums: the basins
+    at or below the controlling tc are a prefix sum of C*A, and the partial-area term for the
+    slower basins is tc_k times a suffix sum of C*A/tc. O(n log n) overall.
+
+    Parameters
+    ----------
+    tc : np.ndarray
+        (n,) tributary tc, minutes.
+    ca : np.ndarray
+        (n, R) C * A per basin and return period, acres.
+    P1 : np.ndarray
+        (R,) one-hour point rainfall per return period.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Peak Q (R,), controlling tc (R,) and the index into tc of the controlling basin (R,).
+    """
+    start = time.perf_counter() if _calc_hook is not None else 0.0
+    tc = np.asarray(tc, dtype=float)
+    ca = np.asarray(ca, dtype=float).reshape(len(tc), -1)
+
+    order = np.argsort(tc, kind="stable")
+    tc_sorted = tc[order]
+    ca_sorted = ca[order]
+
+    ca_full = np.cumsum(ca_sorted, axis=0)
+    # Suffix sums over the basins strictly slower (later in sort order) than each scenario
+    ca_per_tc = ca_sorted / tc_sorted[:, None]
+    ca_slow = np.zeros_like(ca_sorted)
+    ca_slow[:-1] = np.cumsum(ca_per_tc[::-1], axis=0)[::-1][1:]
+
+    q_scenarios = get_intensity(P1, tc_sorted, a=a, b=b, c=c) * (ca_full + tc_sorted[:, None] * ca_slow)
+
+    k = np.argmax(q_scenarios, axis=0)
+    cols = np.arange(q_scenarios.shape[1])
+    if _calc_hook is not None:
+        _calc_hook("route_arrays", {"seconds": time.perf_counter() - start, "n": len(tc)})
+    return q_scenarios[k, cols], tc_sorted[k], order[k]
 
 
 # Run as standalone. Not sure what this will look like yet, and during dev this 
@@ -273,8 +846,7 @@ if __name__ == "__main__":
     )
     sb_list.append(sub_basin_B)
 
-    # Ongoing dev ignore fore now (should be new branch)
-    # route_sbs_at_dp([sub_basin_A, sub_basin_B])
+    dp_q, dp_tc = route_sbs_at_dp([sub_basin_A, sub_basin_B])
 
     for sb in sb_list:
         print('\n')
@@ -288,6 +860,10 @@ if __name__ == "__main__":
             print(f'Area: {a.area_ac}\t Soil Group: {a.nrcs_soil_group}\t Impervious Ratio: {a.impervious_ratio}')
         print('\n-------------------------------')
 
+    print('Design point (A + B)')
+    print(f'Q2:   {dp_q['c002']}\t tc: {dp_tc['c002']}')
+    print(f'Q100: {dp_q['c100']}\t tc: {dp_tc['c100']}')
+
 
 
     debug=True
@@ -0,0 +1,112 @@
+'''
+Struct-of-arrays storage for large record sets (parcel-scale Areas, SWMM-scale Subcatchments).
+
+A RecordArray keeps one contiguous NumPy buffer per field instead of one Python object per
+record. Indexing hands out a small view object that reads and writes through to the buffers,
+so per-record code keeps working while whole-column math runs on the arrays directly.
+
+Subclasses only declare _fields; a matching view class with one property per field is built
+automatically.
+'''
+
+import numpy as np
+
+
+class RecordView:
+    # Lightweight handle on one row of a RecordArray
+    __slots__ = ("_owner", "_index")
+
+    def __init__(self, owner, index: int):
+        self._owner = owner
+        self._index = index
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._owner._fields)
+        return f"{type(self).__name__}({values})"
+
+
+def _field_property(name):
+    def getter(view):
+        value = view._owner._data[name][view._index]
+        # NumPy scalars come back as plain Python values; object fields are returned as stored
+        return value.item() if isinstance(value, np.generic) else value
+
+    def setter(view, value):
+        view._owner._data[name][view._index] = value
+        view._owner._changed(name)
+
+    return property(getter, setter)
+
+
+class RecordArray:
+    # Subclasses set _fields = {"name": dtype, ...}; object dtype is allowed for labels
+    _fields: dict = {}
+    View = RecordView
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        props = {name: _field_property(name) for name in cls._fields}
+        props["__slots__"] = ()
+        cls.View = type(f"{cls.__name__}View", (cls.View,), props)
+
+    def __init__(self, capacity: int = 0, **columns):
+        self._n = 0
+        self._data = {name: np.empty(capacity, dtype=dtype) for name, dtype in self._fields.items()}
+        if columns:
+            self.extend(**columns)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._n
+        if not 0 <= index < self._n:
+            raise IndexError("record index out of range")
+        return self.View(self, index)
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self.View(self, i)
+
+    def column(self, name: str) -> np.ndarray:
+        # Live view of one field (no copy)
+        return self._data[name][:self._n]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr[:self._n].nbytes for arr in self._data.values())
+
+    def _reserve(self, size: int):
+        # Grow every buffer geometrically so repeated appends stay amortized O(1)
+        capacity = len(next(iter(self._data.values()), ()))
+        if size <= capacity:
+            return
+        new_capacity = max(size, 2 * capacity, 16)
+        for name, arr in self._data.items():
+            grown = np.empty(new_capacity, dtype=arr.dtype)
+            grown[:self._n] = arr[:self._n]
+            self._data[name] = grown
+
+    def append(self, **values):
+        self.extend(**{name: [value] for name, value in values.items()})
+
+    def extend(self, **columns):
+        # Add a block of records given as one array per field (every field is required)
+        missing = set(self._fields) - set(columns)
+        if missing:
+            raise ValueError(f"missing fields: {sorted(missing)}")
+        arrays = {name: np.asarray(columns[name]) for name in self._fields}
+        size = len(next(iter(arrays.values())))
+        if any(len(arr) != size for arr in arrays.values()):
+            raise ValueError("all columns must be the same length")
+
+        self._reserve(self._n + size)
+        for name, arr in arrays.items():
+            self._data[name][self._n:self._n + size] = arr
+        self._n += size
+        self._changed(*self._fields)
+
+    def _changed(self, *names):
+        # Hook for subclasses that cache values derived from the columns
+        pass
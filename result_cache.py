@@ -0,0 +1,245 @@
+'''
+Persistent, content-hashed cache of rational-method and pipe results between project runs.
+
+Each basin is keyed by a hash of everything its results depend on (areas, Li/Si/Lt/St/K, a user
+tc and P1_dict); each pipe by its (Q, D, slope, n). On a rerun only the entries whose inputs
+changed are recomputed, in one vectorized batch.
+
+Entries live in a single SQLite file. Every entry records the version it was computed under;
+the version hashes the source of this module and of every project module it imports, directly
+or through rational.py / conduits.py (records.py, ...), so editing a formula makes older entries
+unreachable and they are purged on open. Total size is bounded by evicting the least recently
+used entries, both on open (max_bytes may be lower than when the file was written) and after
+every write.
+'''
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import struct
+import sys
+import time
+import types
+
+import numpy as np
+
+import conduits
+import rational
+
+# Bump when the layout of cached values changes
+CACHE_FORMAT = 1
+
+
+def _project_modules(root) -> list:
+    # root and every module of this project it imports, directly or through other project
+    # modules (e.g. rational -> records). Third-party and standard library modules are skipped
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def in_project(module):
+        path = getattr(module, "__file__", None)
+        return path is not None and os.path.dirname(os.path.abspath(path)) == project_dir
+
+    found = {}
+    stack = [root]
+    while stack:
+        module = stack.pop()
+        if module.__name__ in found:
+            continue
+        found[module.__name__] = module
+        for value in vars(module).values():
+            # Imported modules, and classes / functions imported from one (from x import y)
+            dep = value if isinstance(value, types.ModuleType) else sys.modules.get(getattr(value, "__module__", None) or "")
+            if dep is not None and dep.__name__ not in found and in_project(dep):
+                stack.append(dep)
+    return [found[name] for name in sorted(found)]
+
+
+def code_version() -> str:
+    # Hash of the source of every project module the cached calculations use: any edit there
+    # invalidates the cache
+    h = hashlib.sha256(str(CACHE_FORMAT).encode())
+    for module in _project_modules(sys.modules[__name__]):
+        h.update(module.__name__.encode())
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def _hash_floats(values) -> str:
+    return hashlib.sha256(struct.pack(f"<{len(values)}d", *values)).hexdigest()
+
+
+def subbasin_key(sb: rational.SubBasin) -> str:
+    # Stable hash of a sub-basin's inputs (its name is not an input to the results)
+    values = [sb.Li, sb.Si, sb.Lt, sb.St, sb.K]
+    tc = sb.__dict__.get("_tc_override")
+    values.append(np.nan if tc is None else tc)
+    for a in sb.areas:
+        values.extend((a.area_ac, rational.SOIL_GROUPS.index(a.nrcs_soil_group.upper()), a.impervious_ratio))
+    h = hashlib.sha256(_hash_floats(values).encode())
+    for key, p1 in sb.P1_dict.items():
+        h.update(key.encode())
+        h.update(struct.pack("<d", p1))
+    return "sb:" + h.hexdigest()
+
+
+def pipe_keys(Q, D, slope, manning_n) -> list[str]:
+    rows = np.ascontiguousarray(
+        np.stack(np.broadcast_arrays(*(np.asarray(v, dtype="<f8") for v in (Q, D, slope, manning_n))), axis=-1)
+    ).reshape(-1, 4)
+    return ["pipe:" + hashlib.sha256(row.tobytes()).hexdigest() for row in rows]
+
+
+class ResultCache:
+    def __init__(self, path: str, max_bytes: int = 256 * 2**20, version: str = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = code_version() if version is None else version
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, version TEXT, value BLOB, size INTEGER, last_used REAL)"
+        )
+        # Anything computed by other formula versions can never be hit again
+        self._db.execute("DELETE FROM entries WHERE version != ?", (self.version,))
+        self._evict()
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        # SQLite caps the number of bound parameters, so look keys up in blocks
+        for start in range(0, len(unique), 900):
+            block = unique[start:start + 900]
+            marks = ",".join("?" * len(block))
+            rows = self._db.execute(
+                f"SELECT key, value FROM entries WHERE version = ? AND key IN ({marks})",
+                [self.version, *block],
+            ).fetchall()
+            found.update((key, pickle.loads(value)) for key, value in rows)
+        if found:
+            now = time.time()
+            self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+            self._db.commit()
+        self.hits += sum(k in found for k in keys)
+        self.misses += sum(k not in found for k in keys)
+        return found
+
+    def put_many(self, items: dict):
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, self.version, blob, len(blob), now))
+        self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+        self._evict()
+        self._db.commit()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        excess = self.size_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used ASC"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self):
+        self._db.execute("DELETE FROM entries")
+        self._db.commit()
+
+
+# Cached calculations ----------------------------------------------------------------------------
+
+def cached_subbasin_results(subbasins: list[rational.SubBasin], cache: ResultCache) -> list[dict]:
+    # {"tc", "intensity_dict", "discharge_dict"} per basin; misses are computed as one BasinTable
+    keys = [subbasin_key(sb) for sb in subbasins]
+    found = cache.get_many(keys)
+
+    missing = {}
+    for sb, key in zip(subbasins, keys):
+        if key not in found and key not in missing:
+            missing[key] = sb
+    # One BasinTable per distinct design storm among the misses
+    groups = {}
+    for key, sb in missing.items():
+        groups.setdefault(tuple(sb.P1_dict.items()), []).append((key, sb))
+    for P1_items, members in groups.items():
+        table = rational.BasinTable.from_subbasins([sb for _, sb in members], dict(P1_items))
+        fresh = {
+            key: {
+                "tc": float(table.tc[i]),
+                "intensity_dict": dict(zip(table.return_periods, table.intensity[i].tolist())),
+                "discharge_dict": dict(zip(table.return_periods, table.discharge[i].tolist())),
+            }
+            for i, (key, _) in enumerate(members)
+        }
+        cache.put_many(fresh)
+        found.update(fresh)
+    return [found[key] for key in keys]
+
+
+def cached_route_sbs_at_dp(subbasins: list[rational.SubBasin], cache: ResultCache, P1_dict: dict = None):
+    # route_sbs_at_dp keyed on the (ordered) tributary inputs and the design storm
+    if P1_dict is None:
+        P1_dict = subbasins[0].P1_dict
+    h = hashlib.sha256()
+    for sb in subbasins:
+        h.update(subbasin_key(sb).encode())
+    for key, p1 in P1_dict.items():
+        h.update(key.encode())
+        h.update(struct.pack("<d", p1))
+    key = "dp:" + h.hexdigest()
+
+    found = cache.get_many([key])
+    if key not in found:
+        found[key] = rational.route_sbs_at_dp(subbasins, P1_dict)
+        cache.put_many({key: found[key]})
+    return found[key]
+
+
+def cached_circ_normal_depth(Q, D, slope, manning_n, cache: ResultCache):
+    # circ_normal_depth for arrays of pipes, solving only the (Q, D, slope, n) rows not cached
+    shape = np.broadcast_shapes(*(np.shape(v) for v in (Q, D, slope, manning_n)))
+    cols = [np.broadcast_to(np.asarray(v, dtype=float), shape).ravel() for v in (Q, D, slope, manning_n)]
+    keys = pipe_keys(*cols)
+    found = cache.get_many(keys)
+
+    missing = {}
+    for i, key in enumerate(keys):
+        if key not in found and key not in missing:
+            missing[key] = i
+    if missing:
+        idx = np.fromiter(missing.values(), dtype=np.intp, count=len(missing))
+        y, ok = conduits.circ_normal_depth(*(c[idx] for c in cols))
+        fresh = {key: (float(y[j]), bool(ok[j])) for j, key in enumerate(missing)}
+        cache.put_many(fresh)
+        found.update(fresh)
+
+    y = np.array([found[k][0] for k in keys], dtype=float).reshape(shape)
+    converged = np.array([found[k][1] for k in keys], dtype=bool).reshape(shape)
+    return y, converged
@@ -0,0 +1,233 @@
+'''
+Columnar (Parquet / Arrow IPC) output for discharge tables and runoff time series.
+
+Results are written in long format, one row per (basin or node, return period[, time step]),
+through ColumnarWriter, which buffers rows and writes a row group (Parquet) or record batch
+(Arrow) every row_group_rows rows. A long CUHP run can therefore stream to disk one return
+period or one chunk of nodes at a time without holding the whole result in memory.
+
+Rows are written grouped by return period and then by name, so the min/max statistics of each
+Parquet row group let filtered reads (read_results(..., filters=...), read_series) skip the
+groups they don't need. Files are opened memory-mapped, so only the pages actually read are
+loaded.
+
+The file type follows the extension: .parquet / .pq, or .arrow / .feather for Arrow IPC.
+pyarrow is imported on first use.
+'''
+
+import os
+
+import numpy as np
+
+from rational import RETURN_PERIODS
+
+ROW_GROUP_ROWS = 65536
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+
+
+def _file_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PARQUET_EXTENSIONS:
+        return "parquet"
+    if ext in ARROW_EXTENSIONS:
+        return "arrow"
+    raise ValueError(f"Unsupported results file type: {path}")
+
+
+def _to_arrow(values):
+    import pyarrow as pa
+
+    values = np.asarray(values)
+    # Object columns (names, messages) may hold NaN for missing entries: store those as nulls
+    return pa.array(values, from_pandas=values.dtype == object)
+
+
+class ColumnarWriter:
+    # Streaming writer: write(**columns) any number of times, then close() (or use `with`)
+
+    def __init__(self, path: str, schema=None, row_group_rows: int = ROW_GROUP_ROWS, compression="zstd"):
+        self.path = path
+        self.format = _file_format(path)
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self.compression = compression
+        self.rows_written = 0
+        self._buffer = []
+        self._buffered = 0
+        self._writer = None
+        self._sink = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, **columns):
+        # Append a block of rows given as one array per column (every column, same length)
+        import pyarrow as pa
+
+        batch = pa.table({name: _to_arrow(values) for name, values in columns.items()})
+        if self.schema is None:
+            self.schema = batch.schema
+        self._buffer.append(batch.select(self.schema.names).cast(self.schema))
+        self._buffered += batch.num_rows
+        while self._buffered >= self.row_group_rows:
+            self._flush(self.row_group_rows)
+
+    def _open(self):
+        import pyarrow as pa
+
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        else:
+            self._sink = pa.OSFile(self.path, "wb")
+            self._writer = pa.ipc.new_file(
+                self._sink, self.schema, options=pa.ipc.IpcWriteOptions(compression=None)
+            )
+
+    def _flush(self, rows: int = None):
+        # Write the first `rows` buffered rows (all of them by default) as one row group
+        import pyarrow as pa
+
+        if not self._buffered:
+            return
+        if self._writer is None:
+            self._open()
+        table = pa.concat_tables(self._buffer)
+        rows = table.num_rows if rows is None else rows
+        head, rest = table.slice(0, rows), table.slice(rows)
+        if self.format == "parquet":
+            self._writer.write_table(head, row_group_size=rows)
+        else:
+            self._writer.write_table(head, max_chunksize=rows)
+        self.rows_written += head.num_rows
+        self._buffer = [rest] if rest.num_rows else []
+        self._buffered = rest.num_rows
+
+    def close(self):
+        if self._writer is None and not self._buffered and self.schema is not None:
+            self._open()     # no rows: still write a valid, empty file
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+
+def write_columns(path: str, columns: dict, row_group_rows: int = ROW_GROUP_ROWS):
+    # One-shot {column: values} table (e.g. the CLI's consolidated results)
+    with ColumnarWriter(path, row_group_rows=row_group_rows) as writer:
+        writer.write(**columns)
+    return path
+
+
+# Discharge tables -------------------------------------------------------------------------------
+
+def discharge_columns(table, project: str = None) -> dict:
+    # BasinTable -> long-format columns, one row per (return period, basin)
+    n, R = len(table), len(table.return_periods)
+    c_cols = table.c[:, [RETURN_PERIODS.index(key) for key in table.return_periods]]
+    columns = {
+        "return_period": np.repeat(np.array(table.return_periods, dtype=object), n),
+        "basin": np.tile(table.names.astype(str).astype(object), R),
+        "P1": np.repeat(np.array(list(table.P1_dict.values()), dtype=float), n),
+        "area_ac": np.tile(table.basin_area_ac, R),
+        "tc": np.tile(table.tc, R),
+        "c": c_cols.T.ravel(),
+        "intensity": table.intensity.T.ravel(),
+        "discharge": table.discharge.T.ravel(),
+    }
+    if project is not None:
+        columns = {"project": np.full(n * R, project, dtype=object), **columns}
+    return columns
+
+
+def write_discharge_table(path: str, table, project: str = None, row_group_rows: int = ROW_GROUP_ROWS):
+    return write_columns(path, discharge_columns(table, project), row_group_rows=row_group_rows)
+
+
+# Time series ------------------------------------------------------------------------------------
+
+def write_time_series(writer: ColumnarWriter, return_period: str, names, time_min, flow_cfs):
+    # Append (n_names, n_steps) flows for one return period as long rows
+    flow_cfs = np.asarray(flow_cfs, dtype=float)
+    n, steps = flow_cfs.shape
+    writer.write(
+        return_period=np.full(n * steps, return_period, dtype=object),
+        name=np.repeat(np.asarray(names, dtype=object), steps),
+        time_min=np.tile(np.asarray(time_min, dtype=float), n),
+        flow_cfs=flow_cfs.ravel(),
+    )
+
+
+def write_route_result(writer: ColumnarWriter, return_period: str, result: dict, subcatchments=None):
+    # cuhp.route_to_nodes output; node series, plus subcatchment series when both were kept
+    write_time_series(writer, return_period, result["nodes"], result["time_min"], result["node_flow_cfs"])
+    if subcatchments is not None and "subcatch_flow_cfs" in result:
+        write_time_series(writer, return_period, subcatchments, result["time_min"], result["subcatch_flow_cfs"])
+
+
+# Reading ----------------------------------------------------------------------------------------
+
+def read_results(path: str, columns=None, filters=None):
+    """
+    Memory-mapped read of a results file as a pyarrow Table.
+
+    Parameters
+    ----------
+    columns : list of str, optional
+        Only these columns are read.
+    filters : list of tuple, optional
+        pyarrow filters such as [("basin", "==", "A"), ("return_period", "in", ["c100"])].
+        For Parquet these prune row groups by their statistics before decoding.
+    """
+    import pyarrow as pa
+
+    if _file_format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+    # Arrow IPC: record batches are zero-copy views into the map; filter batch by batch
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+    if filters:
+        expression = _filter_expression(filters[0])
+        for condition in filters[1:]:
+            expression = expression & _filter_expression(condition)
+        table = table.filter(expression)
+    return table.select(columns) if columns else table
+
+
+def _filter_expression(condition):
+    import pyarrow.compute as pc
+
+    name, op, value = condition
+    field = pc.field(name)
+    if op in ("in", "not in"):
+        expr = field.isin(list(value))
+        return ~expr if op == "not in" else expr
+    return {
+        "==": field == value, "=": field == value, "!=": field != value,
+        "<": field < value, "<=": field <= value, ">": field > value, ">=": field >= value,
+    }[op]
+
+
+def read_series(path: str, name: str, return_period: str = None) -> dict:
+    # One basin / node's hydrograph(s): {return_period: (time_min, flow_cfs)}
+    filters = [("name", "==", name)]
+    if return_period is not None:
+        filters.append(("return_period", "==", return_period))
+    table = read_results(path, columns=["return_period", "time_min", "flow_cfs"], filters=filters)
+    rp = table.column("return_period").to_numpy(zero_copy_only=False)
+    time_min = table.column("time_min").to_numpy()
+    flow = table.column("flow_cfs").to_numpy()
+    return {key: (time_min[rp == key], flow[rp == key]) for key in dict.fromkeys(rp)}
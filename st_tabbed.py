@@ -1,41 +1,243 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
 from pydantic import BaseModel, Field, ValidationError
 
+from background import BackgroundJobs, basin_table_job
+from rational import SOIL_GROUPS
+
 # --- 1. DATA VALIDATION MODELS ---
 # These replace manual "if/else" checks with robust engineering constraints.
+# Single-row form entries go through these; bulk uploads are checked column-wise in
+# validate_basin_table / validate_area_table with the same limits.
 
 class AreaInput(BaseModel):
     basin_id: str
     land_use: str
+    soil_group: str = Field(pattern=r"^(A|B|C/D)$")
     # ge = Greater than or Equal to | le = Less than or Equal to
     impervious_fraction: float = Field(
-        ge=0.0, 
-        le=1.0, 
+        ge=0.0,
+        le=1.0,
         description="Imperviousness must be between 0 and 1.0 (0% to 100%)"
     )
     area_acres: float = Field(
-        gt=0.0, 
+        gt=0.0,
         description="Area must be greater than zero"
     )
 
 class BasinInput(BaseModel):
     basin_id: str = Field(min_length=1)
-    tc_min: float = Field(ge=5.0, le=60.0)
+    # None = computed tc, min(normal, regional)
+    tc_min: float | None = Field(default=None, ge=5.0, le=60.0)
+    Li: float = Field(gt=0.0)
+    Si: float = Field(gt=0.0)
+    Lt: float = Field(ge=0.0)
+    St: float = Field(gt=0.0)
+    K: float = Field(gt=0.0)
+
+
+# Internal field -> table header (also the headers expected in uploaded files)
+BASIN_COLUMNS = {
+    "basin_id": "Basin ID",
+    "tc_min": "Tc (min)",
+    "Li": "Li (ft)",
+    "Si": "Si (ft/ft)",
+    "Lt": "Lt (ft)",
+    "St": "St (ft/ft)",
+    "K": "K",
+}
+AREA_COLUMNS = {
+    "basin_id": "Basin ID",
+    "land_use": "Land Use",
+    "soil_group": "Soil Group",
+    "impervious_fraction": "Imperv",
+    "area_acres": "Area (ac)",
+}
+LAND_USES = ["Pavement", "Roofs", "Lawn", "Pasture", "Driveways"]
+
+DEFAULT_P1 = {
+    "cWQE": 0.60,
+    "c002": 0.84,
+    "c005": 1.13,
+    "c010": 1.39,
+    "c025": 1.77,
+    "c050": 2.08,
+    "c100": 2.42,
+    "c500": 3.30
+}
+
+
+# --- 2. SESSION DATA LAYER ---
+# Basins and areas are dicts keyed by basin ID / area number, so saving a basin or adding an
+# area is a single dict assignment. The display DataFrames are rebuilt only when the data
+# version changes, not on every rerun.
+
+def init_state():
+    if 'basins' not in st.session_state:
+        st.session_state.basins = {}        # basin ID -> BasinInput fields
+    if 'areas' not in st.session_state:
+        st.session_state.areas = {}         # area number -> AreaInput fields
+        st.session_state.next_area_id = 0
+    if 'data_version' not in st.session_state:
+        st.session_state.data_version = 0
+        st.session_state.tables = None
+
+
+def save_basins(records: list[dict]):
+    # Add or update (in place, by basin ID)
+    for record in records:
+        st.session_state.basins[record["basin_id"]] = record
+    st.session_state.data_version += 1
+
+
+def add_areas(records: list[dict]):
+    area_id = st.session_state.next_area_id
+    for record in records:
+        st.session_state.areas[area_id] = record
+        area_id += 1
+    st.session_state.next_area_id = area_id
+    st.session_state.data_version += 1
+
+
+def data_tables():
+    # (basins, areas) DataFrames with internal column names, cached per data version
+    cached = st.session_state.tables
+    if cached is None or cached[0] != st.session_state.data_version:
+        df_basins = pd.DataFrame.from_records(list(st.session_state.basins.values()), columns=list(BASIN_COLUMNS))
+        df_areas = pd.DataFrame.from_records(list(st.session_state.areas.values()), columns=list(AREA_COLUMNS))
+        df_basins = df_basins.astype({f: float for f in BASIN_COLUMNS if f != "basin_id"})
+        df_areas = df_areas.astype({"impervious_fraction": float, "area_acres": float})
+        cached = (st.session_state.data_version, df_basins, df_areas)
+        st.session_state.tables = cached
+    return cached[1], cached[2]
+
+
+# --- 3. BULK UPLOAD VALIDATION ---
+# One vectorized pass per rule; a file is only accepted when every row passes.
+
+def read_upload(upload) -> pd.DataFrame:
+    if upload.name.lower().endswith((".xlsx", ".xlsm", ".xls")):
+        return pd.read_excel(upload)
+    return pd.read_csv(upload)
+
+
+def _rule_errors(rules: dict) -> list[str]:
+    # {message: bad-row mask} -> messages with (spreadsheet) row numbers
+    errors = []
+    for message, bad in rules.items():
+        rows = np.flatnonzero(pd.Series(bad).fillna(False).to_numpy(dtype=bool)) + 2     # header is row 1
+        if rows.size:
+            more = f" and {rows.size - 10} more" if rows.size > 10 else ""
+            errors.append(f"{message}: rows {rows[:10].tolist()}{more}")
+    return errors
+
+
+def _missing_headers(df, columns: dict, optional=()):
+    missing = [h for f, h in columns.items() if h not in df.columns and f not in optional]
+    return [f"Missing columns: {missing}"] if missing else []
+
+
+def validate_basin_table(df: pd.DataFrame):
+    # Uploaded basin table -> (records, errors)
+    errors = _missing_headers(df, BASIN_COLUMNS, optional=("tc_min",))
+    if errors:
+        return [], errors
+
+    out = pd.DataFrame({"basin_id": df[BASIN_COLUMNS["basin_id"]].astype("string").str.strip()})
+    for field, header in BASIN_COLUMNS.items():
+        if field != "basin_id":
+            out[field] = pd.to_numeric(df[header], errors="coerce") if header in df else np.nan
+
+    errors = _rule_errors({
+        "Basin ID is blank": out["basin_id"].isna() | (out["basin_id"] == ""),
+        "Basin ID is repeated": out["basin_id"].duplicated(keep=False),
+        "Tc must be blank or 5-60 min": out["tc_min"].notna() & ~out["tc_min"].between(5.0, 60.0),
+        "Li must be > 0": ~(out["Li"] > 0),
+        "Si must be > 0": ~(out["Si"] > 0),
+        "Lt must be >= 0": ~(out["Lt"] >= 0),
+        "St must be > 0": ~(out["St"] > 0),
+        "K must be > 0": ~(out["K"] > 0),
+    })
+    if errors:
+        return [], errors
+    out["basin_id"] = out["basin_id"].astype(str)
+    out["tc_min"] = out["tc_min"].astype(object).where(out["tc_min"].notna(), None)
+    return out.to_dict("records"), []
+
+
+def validate_area_table(df: pd.DataFrame, basin_ids):
+    # Uploaded area table -> (records, errors); every area must name an existing basin
+    errors = _missing_headers(df, AREA_COLUMNS, optional=("land_use",))
+    if errors:
+        return [], errors
+
+    out = pd.DataFrame({
+        "basin_id": df[AREA_COLUMNS["basin_id"]].astype("string").str.strip(),
+        "land_use": df[AREA_COLUMNS["land_use"]].astype("string").fillna("")
+        if AREA_COLUMNS["land_use"] in df else "",
+        "soil_group": df[AREA_COLUMNS["soil_group"]].astype("string").str.strip().str.upper(),
+        "impervious_fraction": pd.to_numeric(df[AREA_COLUMNS["impervious_fraction"]], errors="coerce"),
+        "area_acres": pd.to_numeric(df[AREA_COLUMNS["area_acres"]], errors="coerce"),
+    })
 
+    errors = _rule_errors({
+        "Basin ID is not a saved basin": ~out["basin_id"].isin(list(basin_ids)).fillna(False),
+        f"Soil Group must be one of {list(SOIL_GROUPS)}": ~out["soil_group"].isin(SOIL_GROUPS).fillna(False),
+        "Imperv must be 0-1": ~out["impervious_fraction"].between(0.0, 1.0),
+        "Area must be > 0": ~(out["area_acres"] > 0),
+    })
+    if errors:
+        return [], errors
+    out = out.astype({"basin_id": str, "land_use": str, "soil_group": str})
+    return out.to_dict("records"), []
 
-# --- 2. STREAMLIT UI SETUP ---
+
+# --- 4. BACKGROUND CALCULATIONS ---
+# BasinTable runs the SubBasin formulas for every basin at once (same values as SubBasin), off
+# the script thread in a session-owned BackgroundJobs pool so a long recompute never blocks a
+# rerun. A newer edit cancels (or discards) the job for superseded inputs.
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def rational_results(df_basins: pd.DataFrame, df_areas: pd.DataFrame, P1_items: tuple):
+    # Keyed on table content: reruns that don't change the data (or undo an edit) reuse the
+    # previous results. No spinner: this runs on a worker thread, the Results tab shows progress
+    return basin_table_job(df_basins, df_areas, dict(P1_items))
+
+
+def init_jobs():
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = BackgroundJobs(max_workers=2)
+
+
+def submit_jobs(df_basins: pd.DataFrame, df_areas: pd.DataFrame, P1_dict: dict):
+    # Resubmitted on every rerun; a no-op unless the data or the storm changed
+    jobs = st.session_state.jobs
+    if df_areas.empty:
+        jobs.retain([])
+        return
+    P1_items = tuple(P1_dict.items())
+    content = (st.session_state.data_version, P1_items)
+    jobs.submit(("table",), content, rational_results, df_basins, df_areas, P1_items)
+    jobs.retain([("table",)])
+
+
+# --- 5. STREAMLIT UI SETUP ---
 
 st.set_page_config(layout="wide")
 st.title("MHFD Rational Method - Hydrologic Inputs")
 
-# Initialize Session State DataFrames
-if 'df_basins' not in st.session_state:
-    st.session_state.df_basins = pd.DataFrame(columns=['Basin ID', 'Tc (min)'])
-if 'df_areas' not in st.session_state:
-    st.session_state.df_areas = pd.DataFrame(columns=['Basin ID', 'Land Use', 'Imperv', 'Area (ac)'])
+init_state()
+init_jobs()
+
+with st.sidebar:
+    st.subheader("Design Storm (1-hr P1, in)")
+    P1_dict = {
+        key: st.number_input(key, value=value, min_value=0.0, step=0.01, key=f"P1_{key}")
+        for key, value in DEFAULT_P1.items()
+    }
 
-# --- 3. INPUT FORMS ---
+# --- 6. INPUT FORMS ---
 
 col1, col2 = st.columns(2)
 
@@ -44,20 +246,25 @@ with col1:
         with st.form("basin_form", clear_on_submit=True):
             st.subheader("Add/Update Basin")
             b_id = st.text_input("Unique Basin ID (e.g., 'A1')")
+            auto_tc = st.checkbox("Compute Tc (min of normal and regional)", value=True)
             tc = st.number_input("Time of Concentration (5-60 min)", value=5.0, step=0.1)
-            
+            c1, c2, c3 = st.columns(3)
+            Li = c1.number_input("Initial length Li (ft)", value=100.0, step=10.0)
+            Si = c1.number_input("Initial slope Si (ft/ft)", value=0.02, step=0.005, format="%.4f")
+            Lt = c2.number_input("Travel length Lt (ft)", value=200.0, step=10.0)
+            St = c2.number_input("Travel slope St (ft/ft)", value=0.02, step=0.005, format="%.4f")
+            K = c3.number_input("Conveyance factor K", value=20.0, step=1.0)
+
             submit_basin = st.form_submit_button("Save Basin")
-            
+
             if submit_basin:
                 try:
                     # Validate using Pydantic
-                    valid_basin = BasinInput(basin_id=b_id, tc_min=tc)
-                    
-                    new_row = pd.DataFrame([[valid_basin.basin_id, valid_basin.tc_min]], 
-                                           columns=st.session_state.df_basins.columns)
-                    
+                    valid_basin = BasinInput(
+                        basin_id=b_id, tc_min=None if auto_tc else tc, Li=Li, Si=Si, Lt=Lt, St=St, K=K
+                    )
                     # Update if exists, otherwise add
-                    st.session_state.df_basins = pd.concat([st.session_state.df_basins, new_row]).drop_duplicates('Basin ID', keep='last')
+                    save_basins([valid_basin.model_dump()])
                     st.success(f"Basin {b_id} saved.")
                 except ValidationError as e:
                     st.error(f"Validation Error: {e.errors()[0]['msg']}")
@@ -65,50 +272,108 @@ with col1:
 with col2:
     with st.expander("Area & Land Use Management", expanded=True):
         # Prevent adding areas if no basins exist
-        existing_basins = st.session_state.df_basins['Basin ID'].unique()
-        
+        existing_basins = list(st.session_state.basins)
+
         if len(existing_basins) == 0:
             st.warning("Please add at least one Basin on the left first.")
         else:
             with st.form("area_form", clear_on_submit=True):
                 st.subheader("Add Constituent Area")
                 target_b = st.selectbox("Assign to Basin", existing_basins)
-                l_use = st.selectbox("Land Use Type", ["Pavement", "Roofs", "Lawn", "Pasture", "Driveways"])
+                l_use = st.selectbox("Land Use Type", LAND_USES)
+                soil = st.selectbox("NRCS Soil Group", SOIL_GROUPS)
                 imp = st.number_input("Impervious Fraction (0.0-1.0)", value=0.0, step=0.01)
                 area = st.number_input("Area (acres)", value=0.1, step=0.1)
-                
+
                 submit_area = st.form_submit_button("Add Area to Basin")
-                
+
                 if submit_area:
                     try:
                         # Validate using Pydantic
                         valid_data = AreaInput(
-                            basin_id=target_b, 
-                            land_use=l_use, 
-                            impervious_fraction=imp, 
+                            basin_id=target_b,
+                            land_use=l_use,
+                            soil_group=soil,
+                            impervious_fraction=imp,
                             area_acres=area
                         )
-                        
-                        new_area_row = pd.DataFrame([[
-                            valid_data.basin_id, 
-                            valid_data.land_use, 
-                            valid_data.impervious_fraction, 
-                            valid_data.area_acres
-                        ]], columns=st.session_state.df_areas.columns)
-                        
-                        st.session_state.df_areas = pd.concat([st.session_state.df_areas, new_area_row], ignore_index=True)
+                        add_areas([valid_data.model_dump()])
                         st.success(f"Added {l_use} to Basin {target_b}.")
                     except ValidationError as e:
                         # This catches errors like strings in numeric fields or numbers out of range
                         st.error(f"Input Error: {e.errors()[0]['msg']}")
 
-# --- 4. DATA DISPLAY ---
+with st.expander("Bulk Import (CSV / Excel)"):
+    st.caption(
+        f"Basin headers: {', '.join(BASIN_COLUMNS.values())} (blank Tc = computed).  "
+        f"Area headers: {', '.join(AREA_COLUMNS.values())}."
+    )
+    u1, u2 = st.columns(2)
+    basin_file = u1.file_uploader("Basin table", type=["csv", "xlsx", "xlsm", "xls"], key="basin_upload")
+    area_file = u2.file_uploader("Area table", type=["csv", "xlsx", "xlsm", "xls"], key="area_upload")
+
+    if st.button("Import", disabled=basin_file is None and area_file is None):
+        if basin_file is not None:
+            records, errors = validate_basin_table(read_upload(basin_file))
+            if errors:
+                st.error("Basin table rejected:\n\n" + "\n\n".join(errors))
+            else:
+                save_basins(records)
+                st.success(f"Imported {len(records)} basins.")
+        if area_file is not None:
+            records, errors = validate_area_table(read_upload(area_file), st.session_state.basins.keys())
+            if errors:
+                st.error("Area table rejected:\n\n" + "\n\n".join(errors))
+            else:
+                add_areas(records)
+                st.success(f"Imported {len(records)} areas.")
+
+# --- 7. DATA DISPLAY ---
 
 st.divider()
-tab1, tab2 = st.tabs(["Subcatchment Table", "Area Breakdown"])
+tab1, tab2, tab3 = st.tabs(["Subcatchment Table", "Area Breakdown", "Rational Results"])
+
+df_basins, df_areas = data_tables()
 
 with tab1:
-    st.dataframe(st.session_state.df_basins, use_container_width=True, hide_index=True)
+    st.dataframe(df_basins.rename(columns=BASIN_COLUMNS), use_container_width=True, hide_index=True)
 
 with tab2:
-    st.dataframe(st.session_state.df_areas, use_container_width=True, hide_index=True)
\ No newline at end of file
+    st.dataframe(df_areas.rename(columns=AREA_COLUMNS), use_container_width=True, hide_index=True)
+
+submit_jobs(df_basins, df_areas, P1_dict)
+
+
+def show_results(polling: bool):
+    jobs = st.session_state.jobs
+    if jobs.progress()[1] == 0:
+        st.info("Add basins and areas to compute peak flows.")
+        return
+    if jobs.busy:
+        st.info("Computing rational-method results...")
+
+    for error in jobs.errors().values():
+        st.error(f"Rational-method results failed: {error}")
+
+    result = jobs.results().get(("table",))
+    if result is not None:
+        results = result["table"]
+        if results.empty:
+            st.info("Add areas to the basins to compute peak flows.")
+        else:
+            q_cols = [f"Q_{key}" for key in P1_dict if f"Q_{key}" in results]
+            st.dataframe(results[["area_ac", "pct_imp", "tc", *q_cols]], use_container_width=True)
+            # All basins drain to one outlet until design points are added to the app
+            outlet = result["outlet"]
+            st.subheader("Outlet (all basins)")
+            st.dataframe(pd.DataFrame({"Q (cfs)": outlet["q"], "tc (min)": outlet["tc"]}).T, use_container_width=True)
+
+    # Stop polling once the job has finished, whether it succeeded or failed
+    if polling and not jobs.busy:
+        st.rerun()
+
+
+with tab3:
+    # While the job is running the fragment refreshes itself; the rest of the page is not rerun
+    polling = st.session_state.jobs.busy
+    st.fragment(run_every=1.0 if polling else None)(show_results)(polling)
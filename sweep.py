@@ -0,0 +1,245 @@
+'''
+Scenario / sensitivity sweeps of design-point Q and outlet-pipe depth across a process pool.
+
+The base model (basin columns, an AreaArray, an optional outlet pipe) and the parameter table
+(one row per realization) are placed in shared memory once; workers attach to them and process
+realizations in chunks, sending back only running summary statistics. Nothing per-realization
+is pickled, so throughput scales with the number of cores.
+
+Parameters that can be swept (each an array with one value per realization):
+    imp_scale   multiplier on every area's impervious ratio (clipped to 0-1), default 1
+    tc_method   0 = min(normal, regional) as in SubBasin, 1 = normal, 2 = regional, default 0
+    P1_scale    multiplier on every P1 depth, default 1
+    manning_n   outlet pipe roughness, default 0.013
+'''
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import conduits
+import rational
+
+PARAM_DEFAULTS = {"imp_scale": 1.0, "tc_method": 0.0, "P1_scale": 1.0, "manning_n": 0.013}
+
+
+class SummaryStats:
+    # Streaming count / mean / variance / min / max (Welford, with Chan's merge for chunks).
+    # Non-finite values (realizations whose Q or depth failed) are left out of the statistics
+    # and counted in n_failed instead
+
+    def __init__(self):
+        self.count = 0
+        self.n_failed = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        finite = np.isfinite(values)
+        self.n_failed += int(values.size - finite.sum())
+        values = values[finite]
+        if values.size == 0:
+            return self
+        other = SummaryStats()
+        other.count = values.size
+        other.mean = float(values.mean())
+        other._m2 = float(((values - other.mean)**2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        return self.merge(other)
+
+    def merge(self, other: "SummaryStats"):
+        self.n_failed += other.n_failed
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self._m2 += other._m2 + delta**2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        return float(np.sqrt(self._m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+    def as_dict(self):
+        return {"count": self.count, "n_failed": self.n_failed, "mean": self.mean, "std": self.std, "min": self.min, "max": self.max}
+
+
+def grid(**axes):
+    # Full factorial parameter table: grid(imp_scale=[0.9, 1, 1.1], tc_method=[1, 2])
+    names = list(axes)
+    rows = list(itertools.product(*(np.atleast_1d(axes[n]) for n in names)))
+    return {n: np.array([r[i] for r in rows], dtype=float) for i, n in enumerate(names)}
+
+
+def monte_carlo(n: int, seed=None, **samplers):
+    # Random parameter table: monte_carlo(10_000, imp_scale=lambda rng, n: rng.normal(1, 0.05, n))
+    rng = np.random.default_rng(seed)
+    return {name: np.asarray(sample(rng, n), dtype=float) for name, sample in samplers.items()}
+
+
+# Shared memory plumbing ------------------------------------------------------------------------
+
+def _share(arrays: dict):
+    # Copy arrays into new shared memory blocks; returns the blocks and specs workers can attach to
+    blocks, specs = [], {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        specs[name] = (shm.name, arr.shape, arr.dtype.str)
+    return blocks, specs
+
+
+_WORKER = {}
+
+
+def _attach(specs: dict, P1_dict: dict, return_period: str, pipe):
+    # Process-pool initializer: map the shared arrays once per worker
+    blocks = []
+    arrays = {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _WORKER.update(blocks=blocks, arrays=arrays, P1_dict=P1_dict, return_period=return_period, pipe=pipe)
+
+
+def _run_chunk(start: int, stop: int):
+    a = _WORKER["arrays"]
+    P1_dict = _WORKER["P1_dict"]
+    rp_col = list(P1_dict).index(_WORKER["return_period"])
+    c_col = rational.RETURN_PERIODS.index(_WORKER["return_period"])
+    p1 = np.array(list(P1_dict.values()), dtype=float)
+    n_basins = len(a["Li"])
+
+    q = np.empty(stop - start)
+    tc = np.empty(stop - start)
+    for j, r in enumerate(range(start, stop)):
+        table = rational.BasinTable(
+            np.arange(n_basins), a["Li"], a["Si"], a["Lt"], a["St"], a["K"],
+            a["basin_idx"], a["area_ac"], a["soil_code"],
+            np.clip(a["impervious_ratio"] * a["imp_scale"][r], 0.0, 1.0),
+            dict(zip(P1_dict, p1 * a["P1_scale"][r])),
+        )
+        method = int(a["tc_method"][r])
+        basin_tc = table.tc if method == 0 else (table.tc_normal if method == 1 else table.tc_region)
+        ca = table.basin_area_ac * table.c[:, c_col]
+        peak_q, peak_tc, _ = rational.route_arrays(basin_tc, ca, p1[rp_col:rp_col + 1] * a["P1_scale"][r])
+        q[j], tc[j] = peak_q[0], peak_tc[0]
+
+    stats = {"Q": SummaryStats().update(q), "tc": SummaryStats().update(tc)}
+    pipe = _WORKER["pipe"]
+    if pipe is not None:
+        y, ok = conduits.circ_normal_depth(q, pipe["D"], pipe["slope"], a["manning_n"][start:stop])
+        # Depth only exists below capacity: surcharged rows are not failures of the depth stats
+        stats["depth_ratio"] = SummaryStats().update(y[ok] / pipe["D"])
+        # NaN for failed realizations, so they count in n_failed and not as surcharged
+        stats["surcharged"] = SummaryStats().update(np.where(np.isfinite(q), ~ok, np.nan))
+    return stats
+
+
+def run_sweep(
+    basins: dict,
+    areas: rational.AreaArray,
+    P1_dict: dict[str, float],
+    params: dict,
+    return_period: str = "c100",
+    pipe: dict = None,
+    n_workers: int = None,
+    chunk_size: int = 256,
+    on_chunk=None,
+):
+    """
+    Run every realization of params and return summary statistics.
+
+    Parameters
+    ----------
+    basins : dict
+        Basin columns "Li", "Si", "Lt", "St", "K" (e.g. from loaders.load_basins). All basins are
+        treated as tributary to one design point.
+    areas : AreaArray
+        Area records with basin_idx pointing into the basin columns.
+    P1_dict : dict
+        Base design storm.
+    params : dict
+        Parameter table from grid() / monte_carlo(); see the module docstring for names.
+    return_period : str
+        P1_dict key whose routed Q is analysed.
+    pipe : dict, optional
+        {"D": ft, "slope": ft/ft} of the outlet pipe to check with each realization's Q.
+    n_workers : int, optional
+        Process count (default: all cores). 1 runs in-process.
+    chunk_size : int
+        Realizations per task.
+    on_chunk : callable, optional
+        Called as on_chunk(done, total, stats_so_far) as chunks stream back.
+
+    Returns
+    -------
+    dict
+        {"Q", "tc", and with a pipe "depth_ratio", "surcharged"} -> SummaryStats.
+        "surcharged" is the fraction of realizations above the pipe's capacity, among those
+        with a finite Q; realizations whose Q could not be computed are counted in n_failed.
+        "depth_ratio" covers the realizations that flow partly full.
+    """
+    n_real = len(next(iter(params.values())))
+    table = {name: np.broadcast_to(np.asarray(params.get(name, default), dtype=float), (n_real,))
+             for name, default in PARAM_DEFAULTS.items()}
+    unknown = set(params) - set(PARAM_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+
+    shared = {name: np.asarray(basins[name], dtype=float) for name in ("Li", "Si", "Lt", "St", "K")}
+    shared.update({name: areas.column(name) for name in ("basin_idx", "area_ac", "soil_code", "impervious_ratio")})
+    shared.update(table)
+
+    chunks = [(s, min(s + chunk_size, n_real)) for s in range(0, n_real, chunk_size)]
+    totals = {}
+    done = 0
+
+    def collect(stats):
+        nonlocal done
+        for name, s in stats.items():
+            totals.setdefault(name, SummaryStats()).merge(s)
+        done += 1
+        if on_chunk is not None:
+            on_chunk(done, len(chunks), totals)
+
+    blocks, specs = _share(shared)
+    try:
+        n_workers = n_workers or os.cpu_count() or 1
+        if n_workers == 1:
+            _attach(specs, P1_dict, return_period, pipe)
+            try:
+                for start, stop in chunks:
+                    collect(_run_chunk(start, stop))
+            finally:
+                for shm in _WORKER.pop("blocks", []):
+                    shm.close()
+                _WORKER.clear()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_attach,
+                initargs=(specs, P1_dict, return_period, pipe),
+            ) as pool:
+                futures = [pool.submit(_run_chunk, start, stop) for start, stop in chunks]
+                for future in as_completed(futures):
+                    collect(future.result())
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return totals